@@ -5,6 +5,7 @@ import time
 import threading
 import shutil
 import json
+import multiprocessing
 import webbrowser
 import tkinter as tk
 import tkinter.constants
@@ -601,7 +602,6 @@ class App:
         game = self.game.get()
         outputDir += f"/{vmfName}_{game}"
         print(f"Opening VMF file \"{vmfPath}\"...")
-        vmfFile = open(vmfPath).read()
         print("Reading VMF file...")
 
         
@@ -622,11 +622,13 @@ class App:
         writePath = f"map_source/{prefabDir}/{vmfName}" if game == "BO3" else "map_source"
         print("Generating map data...")
 
-        with open(f"{outputDir}/{writePath}/{vmfName}.map", "w") as file:
+        # the vmf file is read while the map is exported, so it stays open until the export is done
+        with open(vmfPath) as vmfFile, open(f"{outputDir}/{writePath}/{vmfName}.map", "w") as file:
             exportMap(
                 vmfFile, vpkFiles, gameDirs, game,
                 self.skipMats.get(), self.skipModels.get(), vmfName, settings["convertBrush"],
-                scale=Vector3(settings["scale"][0], settings["scale"][0], settings["scale"][1]), file=file
+                scale=Vector3(settings["scale"][0], settings["scale"][0], settings["scale"][1]), file=file,
+                workers=settings.get("workers", 0)
             )
 
         convertedDir = gettempdir() + "/corvid/converted"
@@ -721,6 +723,9 @@ class TextRedirector(object):
             self.widget.see("end")
 
 if __name__ == "__main__":
+    # needed for the brush conversion workers in frozen builds
+    multiprocessing.freeze_support()
+
     root = tk.Tk()
     app = App(root)
 
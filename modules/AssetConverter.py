@@ -1,76 +1,184 @@
 import os
-from os.path import splitext, exists
+from os.path import basename
 os.environ["NO_BPY"] = "1"
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 from SourceIO.source1.vtf.VTFWrapper import VTFLib
 from .Vector2 import Vector2
 from .Vector3 import Vector3
 from tempfile import gettempdir
-from .Static import newPath
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PyCoD import Model
-from .ModelConverter import convertModel
+from .ModelConverter import convertModel, convertModelBin, getFileName
+from .SourceDir import SourceDir, readLocation
+from .Cache import hashKey, loadFile, saveFile
+from .Vtf import readHeader, getDxtData, decodeDxt, writeDds
 
 tempDir = gettempdir() + "/corvid"
 
-def convertImage(src, dest, format="rgba", invert=False, resize=False):
-    if not exists(src):
-        print(f"{src} could not be found")
-        return False
-    format = format.upper()
-    image = VTFLib.VTFLib()
-    image.image_load(src)
-    width = image.width()
-    height = image.height()
-    rgba = Image.frombuffer("RGBA", (width, height), image.convert_to_rgba8888().contents)
+# decodes the content of a vtf file to an image with the given channels: "RGBA", "RGB" or a single channel
+# dxt1 and dxt5 textures are decoded here, straight to the channels that are needed, anything else goes through VTFLib
+# images smaller than 4x4 are scaled up
+def decodeImage(data, channels="RGBA") -> Image.Image:
+    header = readHeader(data)
+    blocks = getDxtData(data, header) if header is not None else None
+
+    if blocks is not None and header.width >= 4 and header.height >= 4:
+        pixels = decodeDxt(blocks, header.width, header.height, header.format, channels)
+        return Image.fromarray(pixels[:, :, 0] if len(channels) == 1 else pixels)
+
+    if blocks is not None:
+        rgba = Image.fromarray(decodeDxt(blocks, header.width, header.height, header.format))
+    else:
+        image = VTFLib.VTFLib()
+        image.image_load_from_buffer(bytes(data))
+        width = image.width()
+        height = image.height()
+        rgba = Image.frombuffer("RGBA", (width, height), image.convert_to_rgba8888().contents)
+
+    # the channels are taken out after scaling, scaling an rgba image premultiplies its alpha
     if rgba.size[0] < 4 or rgba.size[1] < 4:
         x = max(rgba.size[0], 4)
         y = max(rgba.size[1], 4)
         rgba = rgba.resize((x, y))
+    if channels == "RGB":
+        rgba = rgba.convert("RGB")
+    elif len(channels) == 1:
+        rgba = rgba.getchannel(channels)
+    return rgba
+
+# the channels a texture has to be decoded to for a list of outputs,
+# the ones that are resized need all of them for the same reason as in decodeImage
+def getChannels(outputs) -> str:
+    formats = {format.upper() for _, format, _, _ in outputs}
+    if any(resize for *_, resize in outputs):
+        return "RGBA"
+    if len(formats) == 1 and len(min(formats)) == 1:
+        return min(formats)
+    return "RGBA" if "RGBA" in formats or "A" in formats else "RGB"
+
+# saves a decoded image in the format it's needed in and returns what was saved
+# images that were decoded to a single channel are already in that format
+def saveImage(rgba: Image.Image, dest, format="rgba", invert=False, resize=False) -> Image.Image:
+    format = format.upper()
     if resize:
         rgba = rgba.resize((512, 512))
     if invert:
-        rgba = ImageOps.invert(rgba.convert("RGB"))
+        rgba = ImageOps.invert(rgba if rgba.mode == "L" else rgba.convert("RGB"))
     if format == "RGBA":
-        rgba.save(dest)
+        image = rgba
     elif format == "RGB":
-        rgba.convert("RGB").save(dest)
+        image = rgba.convert("RGB")
     elif len(format) == 1:
-        rgba.getchannel(format).save(dest)
-
-def convertImages(images, src, dest, ext="tga"):
-    images["colorMaps"] = list(dict.fromkeys(images["colorMaps"]))
-    images["colorMapsAlpha"] = list(dict.fromkeys(images["colorMapsAlpha"]))
-    images["normalMaps"] = list(dict.fromkeys(images["normalMaps"]))
-    images["envMaps"] = list(dict.fromkeys(images["envMaps"]))
-    images["envMapsAlpha"] = list(dict.fromkeys(images["envMapsAlpha"]))
-    images["revealMaps"] = list(dict.fromkeys(images["revealMaps"]))
-
-    lencolorMaps = len(images["colorMaps"]) 
-    lencolorMapsAlpha = len(images["colorMapsAlpha"]) 
-    lennormalMaps = len(images["normalMaps"]) 
-    lenenvMaps = len(images["envMaps"]) 
-    lenenvMapsAlpha = len(images["envMapsAlpha"]) 
-    lenrevealMaps = len(images["revealMaps"])
-    total = lencolorMaps + lencolorMapsAlpha + lennormalMaps + lenenvMaps + lenenvMapsAlpha + lenrevealMaps
-
-    for i, file in enumerate(images["colorMapsAlpha"]):
-        print(f"{i}|{total}|done", end="")
-        convertImage(f"{tempDir}/{src}/{file}.vtf", f"{tempDir}/converted/{dest}/{file}.{ext}", "rgba")
-    for i, file in enumerate(images["normalMaps"], lencolorMapsAlpha):
-        print(f"{i}|{total}|done", end="")
-        convertImage(f"{tempDir}/{src}/{file}.vtf", f"{tempDir}/converted/{dest}/{file}.{ext}", "rgb")
-    for i, file in enumerate(images["envMaps"], lencolorMapsAlpha + lennormalMaps):
-        print(f"{i}|{total}|done", end="")
-        convertImage(f"{tempDir}/{src}/{file}.vtf", f"{tempDir}/converted/{dest}/{file}.{ext}", "rgb")
-    for i, file in enumerate(images["envMapsAlpha"], lencolorMapsAlpha + lennormalMaps + lenenvMaps):
-        print(f"{i}|{total}|done", end="")
-        convertImage(f"{tempDir}/{src}/{file}.vtf", f"{tempDir}/converted/{dest}/{file}_.{ext}", "a")
-    for i, file in enumerate(images["revealMaps"], lencolorMapsAlpha + lennormalMaps + lenenvMaps + lenenvMapsAlpha):
-        print(f"{i}|{total}|done", end="")
-        convertImage(f"{tempDir}/{src}/{file}.vtf", f"{tempDir}/converted/{dest}/{file}.{ext}", "g", True)
-    for i, file in enumerate(images["colorMaps"], lencolorMapsAlpha + lennormalMaps + lenenvMaps + lenenvMapsAlpha + lenrevealMaps):
-        print(f"{i}|{total}|done", end="")
-        convertImage(f"{tempDir}/{src}/{file}.vtf", f"{tempDir}/converted/{dest}/{file}.{ext}", "rgb")
+        image = rgba if rgba.mode == "L" else rgba.getchannel(format)
+    image.save(dest)
+    return image
+
+# dxt textures can be written to dds files without decoding them, if the converter of the game accepts those
+# returns False if the texture isn't in a format that can be copied like that
+def copyDds(data, dest) -> bool:
+    header = readHeader(data)
+    blocks = getDxtData(data, header) if header is not None else None
+    if blocks is None:
+        return False
+
+    writeDds(blocks, header, dest)
+    return True
+
+# data is the content of a vtf file, or None if it couldn't be found
+# outputs are the (dest, format, invert, resize) of every file the texture is converted to
+# the texture is decoded once for all of them, and only if one of them isn't in the cache
+# returns the image of each file, the ones that weren't decoded here are only opened from the file when load is set
+def convertImageOutputs(data, outputs, load=False) -> list:
+    if data is None:
+        for dest, *_ in outputs:
+            print(f"The source texture of {basename(dest)} could not be found")
+        return [None] * len(outputs)
+
+    res = [None] * len(outputs)
+    missing = []
+    for i, (dest, format, invert, resize) in enumerate(outputs):
+        # textures that were converted the same way before are taken from the cache
+        key = hashKey(data, format.lower(), invert, resize)
+        if loadFile("textures", key, dest):
+            if load:
+                res[i] = Image.open(dest)
+        # dds files of the full texture get the compressed data as it is
+        elif dest.lower().endswith(".dds") and format.upper() in ("RGB", "RGBA") and not invert and not resize and copyDds(data, dest):
+            if load:
+                res[i] = Image.open(dest)
+            saveFile("textures", key, dest)
+        else:
+            missing.append((i, key))
+
+    if len(missing) > 0:
+        rgba = decodeImage(data, getChannels([outputs[i] for i, _ in missing]))
+        for i, key in missing:
+            res[i] = saveImage(rgba, *outputs[i])
+            saveFile("textures", key, outputs[i][0])
+    return res
+
+def convertImage(data, dest, format="rgba", invert=False, resize=False, load=True):
+    return convertImageOutputs(data, [(dest, format, invert, resize)], load)[0]
+
+# converts a texture in a worker process, the file is read there as well so its data doesn't have to be sent to it
+def convertImageJob(job):
+    location, outputs = job
+    convertImageOutputs(readLocation(location), outputs)
+
+def convertImages(images, dir: SourceDir, dest, ext="tga", workers=0):
+    # every file is converted once, if the same file is in more than one list the last one wins
+    # the same way it did when the lists were converted one after another
+    categories = [
+        ("colorMapsAlpha", "", "rgba", False),
+        ("normalMaps", "", "rgb", False),
+        ("envMaps", "", "rgb", False),
+        ("envMapsAlpha", "_", "a", False),
+        ("revealMaps", "", "g", True),
+        ("colorMaps", "", "rgb", False)
+    ]
+    textures = images["textures"]
+    files = {}
+    for category, suffix, format, invert in categories:
+        for file in images[category]:
+            location = dir.locate(textures[file]) if file in textures else None
+            path = f"{tempDir}/converted/{dest}/{file}{suffix}.{ext}"
+            # a texture that can't be found doesn't replace one that was
+            if location is not None or path not in files:
+                files[path] = (location, (path, format, invert, False))
+
+    # the files are grouped by the texture they come from so each texture is decoded once,
+    # the ones that can't be found are only reported
+    jobs = {}
+    for location, output in files.values():
+        if location is None:
+            convertImage(None, output[0], load=False)
+        else:
+            jobs.setdefault(location, []).append(output)
+    jobs = list(jobs.items())
+
+    # the biggest textures are started first so the workers don't end up waiting on a few big ones at the end
+    def size(job):
+        path, _, length, preload = job[0]
+        return len(preload) + (length if length >= 0 else os.path.getsize(path))
+    jobs.sort(key=size, reverse=True)
+
+    total = len(jobs)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(convertImageJob, job): job for job in jobs}
+            for i, future in enumerate(as_completed(futures)):
+                print(f"{i}|{total}|done", end="")
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Could not convert {basename(futures[future][1][0][0])}: {e}")
+    else:
+        for i, job in enumerate(jobs):
+            print(f"{i}|{total}|done", end="")
+            try:
+                convertImageJob(job)
+            except Exception as e:
+                print(f"Could not convert {basename(job[1][0][0])}: {e}")
 
     # create 404 image for the textures that aren't found
     h = 512
@@ -100,67 +208,69 @@ def convertImages(images, src, dest, ext="tga"):
 
     img.save(f"{tempDir}/converted/{dest}/404.{ext}")
 
-def getTexSize(src):
-    image = VTFLib.VTFLib()
-    image.image_load(src)
-    return Vector2(image.width(), image.height())
+# data only needs to be the header of the vtf file
+def getTexSize(data):
+    header = readHeader(data)
+    # same size VTFLib reports when it can't load an image
+    if header is None:
+        return Vector2(0, 0)
+    return Vector2(header.width, header.height)
 
-def convertModels(models, modelTints, modelSkins, skinTints, game="WaW", scale=1.0):
+def convertModels(models, materials, modelTints, modelSkins, skinTints, game="WaW", scale=1.0):
     codModel = Model()
-    mdlDir = f"{tempDir}/mdl"
     convertDir = f"{tempDir}/converted/model_export/corvid"
+    ext = "xmodel_bin" if game == "BO3" else "xmodel_export"
     total = len(models)
 
-    for i, model in enumerate(models):
+    for i, (name, model) in enumerate(models.items()):
         print(f"{i}|{total}|done", end="")
-        model = splitext(newPath(model))[0]
+
+        # the tints and skins of the model that need to be converted
+        variants = []
         # convert models with tints
-        if game == "BO3" and model in modelTints:
-            for tint in modelTints[model]:
-                hex = Vector3.FromStr(tint).toHex()
-                convertModel(f"{mdlDir}/{model}", convertDir, tint=hex, scale=scale)
+        if game == "BO3" and name in modelTints:
+            variants += [(Vector3.FromStr(tint).toHex(), 0) for tint in modelTints[name]]
+        variants.append(("", 0))
+
+        # convert models with skins
+        if name in modelSkins:
+            variants += [("", skin) for skin in modelSkins[name]]
+
+        if game == "BO3" and name in skinTints:
+            variants += [(Vector3.FromStr(tint).toHex(), skin) for skin, tints in skinTints[name].items() for tint in tints]
+
+        if not model.readMdl():
+            print(f"Can't find {name}.mdl. Skipping...")
+            continue
+        modelHash = hashKey([model.files[ext] for ext in sorted(model.files)])
+
+        for tint, skin in variants:
+            fileName = getFileName(name, tint, skin)
+            dest = f"{convertDir}/{fileName}.{ext}"
+
+            # models that were converted the same way before are taken from the cache
+            key = hashKey(modelHash.encode(), fileName, scale, skin, tint, model.getMaterials(materials, skin, tint))
+            if loadFile("models", key, dest):
+                continue
+
+            if game == "BO3":
+                if not model.readGeometry():
+                    break
+                # the xmodel_bin is written straight from the model data, and through an xmodel_export file if that fails
+                if convertModelBin(model, dest, materials, tint, skin, scale):
+                    saveFile("models", key, dest)
+                    continue
+
+                convertModel(model, convertDir, materials, tint, skin, scale)
                 try:
-                    codModel.LoadFile_Raw(f"{convertDir}/{model}_{hex}.xmodel_export")
-                    codModel.WriteFile_Bin(f"{convertDir}/{model}_{hex}.xmodel_bin")
+                    codModel.LoadFile_Raw(f"{convertDir}/{fileName}.xmodel_export")
+                    codModel.WriteFile_Bin(dest)
                 except:
-                    print(f"Could not convert {model}_{hex} to xmodel_bin...")
+                    print(f"Could not convert {fileName} to xmodel_bin...")
+                    continue
                 else:
-                    os.remove(f"{convertDir}/{model}_{hex}.xmodel_export")
-        convertModel(f"{mdlDir}/{model}", convertDir, scale=scale)
+                    os.remove(f"{convertDir}/{fileName}.xmodel_export")
+            elif not convertModel(model, convertDir, materials, tint, skin, scale):
+                break
 
-        # convert models with skins
-        if model in modelSkins:
-            for skin in modelSkins[model]:
-                convertModel(f"{mdlDir}/{model}", convertDir, skin=skin, scale=scale)
-                if game == "BO3":
-                    try:
-                        codModel.LoadFile_Raw(f"{convertDir}/{model}_skin{skin}.xmodel_export")
-                        codModel.WriteFile_Bin(f"{convertDir}/{model}_skin{skin}.xmodel_bin")
-                    except:
-                        print(f"Could not convert {model} to xmodel_bin...")
-                    else:
-                        os.remove(f"{convertDir}/{model}_skin{skin}.xmodel_export")
-        
-        if game == "BO3" and  model in skinTints:
-            for skin, tints in skinTints[model].items():
-                for tint in tints:
-                    hex = Vector3.FromStr(tint).toHex()
-                    convertModel(f"{mdlDir}/{model}", convertDir, hex, skin, scale)
-                    try:
-                        codModel.LoadFile_Raw(f"{convertDir}/{model}_skin{skin}_{hex}.xmodel_export")
-                        codModel.WriteFile_Bin(f"{convertDir}/{model}_skin{skin}_{hex}.xmodel_bin")
-                    except:
-                        print(f"Could not convert {model} to xmodel_bin...")
-                    else:
-                        os.remove(f"{convertDir}/{model}_skin{skin}_{hex}.xmodel_export")
-
-
-
-        if game == "BO3":
-            try:
-                codModel.LoadFile_Raw(f"{convertDir}/{model}.xmodel_export")
-                codModel.WriteFile_Bin(f"{convertDir}/{model}.xmodel_bin")
-            except:
-                print(f"Could not convert {model} to xmodel_bin...")
-            else:
-                os.remove(f"{convertDir}/{model}.xmodel_export")
+            saveFile("models", key, dest)
@@ -1,34 +1,33 @@
 import os
 os.environ["NO_BPY"] = "1"
+import numpy as np
 from PIL import Image
 from SourceIO.source1.vtf.VTFWrapper import VTFLib
 from modules.Vector3 import Vector3
 from modules.Vector2 import Vector2
-from modules.cube2equi import find_corresponding_pixel
+from modules.cube2equi import convert_cubemap, FACE_X_NEG, FACE_X_POS, FACE_Y_NEG, FACE_Y_POS, FACE_Z_NEG, FACE_Z_POS
 from modules.vdfutils import parse_vdf
-from os.path import basename, splitext, dirname, exists
-from os import listdir
+from os.path import basename, splitext, dirname
 from .Static import fixVmt, newPath
 from .Gdt import Gdt
 from tempfile import gettempdir
 from .AssetConverter import getTexSize, convertImage
-from SourceIO.source1.mdl.mdl_file import Mdl
+from .ModelConverter import SourceModel
 from pathlib import Path
-from .SourceDir import SourceDir
+from io import BytesIO
+from typing import Dict, Optional
+from .SourceDir import SourceDir, decodeText
+from .Vtf import HEADER_SIZE
 
 tempDir = f"{gettempdir()}/corvid"
 
-def copyMaterials(mats, dir: SourceDir):
-    res = []
-    total = len(mats)
-    for i, mat in enumerate(mats):
-        print(f"{i}|{total}|done", end="")
-        name = newPath(mat)
-        dir.copy(f"materials/{mat}.vmt", f"{tempDir}/mat/{name}.vmt")
-        res.append(name)
-    return res
+# returns the text of each material, or None for the ones that can't be found
+def copyMaterials(mats, dir: SourceDir) -> Dict[str, Optional[str]]:
+    paths = {newPath(mat): f"materials/{mat}.vmt" for mat in mats}
+    files = dir.fetchAll(paths.values())
+    return {name: decodeText(files[path]) for name, path in paths.items()}
 
-def copyTextures(mats, dir: SourceDir, mdl=False):
+def copyTextures(mats: Dict[str, Optional[str]], dir: SourceDir, mdl=False):
     res = {
         "sizes": {}, # save the dimensions of $basetexture
         "colorMaps": [],
@@ -37,30 +36,37 @@ def copyTextures(mats, dir: SourceDir, mdl=False):
         "envMapsAlpha": [],
         "normalMaps": [],
         "revealMaps": [],
+        "textures": {}, # paths of the textures that exist, they are read from the game files when they are converted
         "vmts": {} # save vmt data to create GDT's later
     }
-    if not mdl:
-        vmtDir, vtfDir = "mat", "matTex"
-    else:
-        vmtDir, vtfDir = "mdlMats", "mdlTex"
+
+    def findTexture(texture, name):
+        path = f"materials/{texture}.vtf"
+        if dir.exists(path):
+            res["textures"][name] = path
+        else:
+            print(f"Could not find file {path}")
+
+    # the textures whose sizes are needed, they are read all at once after the materials are done
+    sizes = {}
+
     total = len(mats)
-    for i, file in enumerate(mats):
+    for i, (file, vmtText) in enumerate(mats.items()):
         print(f"{i}|{total}|done", end="")
         fileName = basename(file)
-        vmtPath = f"{tempDir}/{vmtDir}/{fileName}.vmt"
-        if not exists(vmtPath):
+        if vmtText is None:
             print(f"Could not find material {fileName}. Creating an empty material for it...")
             res["vmts"][fileName] = parse_vdf('lightmappedgeneric\n{\n"$basetexture" "404"\n}')
             res["sizes"][file.strip()] = Vector2(512, 512)
-            return res
+            break
 
         try:
-            vmt = parse_vdf(fixVmt(open(vmtPath).read()))
+            vmt = parse_vdf(fixVmt(vmtText))
             res["vmts"][fileName] = vmt
             shader = list(vmt)[0]
             mat = vmt[shader]
         except:
-            print(f"Could not parse {vmtPath}. Skipping...")
+            print(f"Could not parse {fileName}.vmt. Skipping...")
 
         # some materials in Source can reference & inherit other materials' properties
         if "include" in mat:
@@ -70,9 +76,10 @@ def copyTextures(mats, dir: SourceDir, mdl=False):
             if not includeFile.endswith(".vmt"):
                 includeFile += ".vmt"
             includeFile = Path(includeFile).as_posix().lower().strip()
-            if dir.copy(includeFile, f"{tempDir}/{vmtDir}/{newPath(includeFile)}"):
+            includeText = dir.open(includeFile, False)
+            if includeText is not None:
                 try:
-                    includeVmt = parse_vdf(fixVmt(open(f"{tempDir}/{vmtDir}/{newPath(includeFile)}").read()))
+                    includeVmt = parse_vdf(fixVmt(includeText))
                     patch = list(includeVmt)[0]
                     includeMat = includeVmt[patch]
                     mat = {**includeMat, **mat}
@@ -89,10 +96,10 @@ def copyTextures(mats, dir: SourceDir, mdl=False):
         if "$basetexture" in mat:
             baseTexture = mat["$basetexture"].strip()
             name = newPath(splitext(baseTexture)[0], True)
-            dir.copy(f"materials/{baseTexture}.vtf", f"{tempDir}/{vtfDir}/{name}.vtf")
+            findTexture(baseTexture, name)
         if not mdl: # we don't need to get the dimensions of model textures
             if "$basetexture" in mat:
-                res["sizes"][file.strip()] = getTexSize(f"{tempDir}/{vtfDir}/{name}.vtf")
+                sizes[file.strip()] = name
             else:
                 res["sizes"][file.strip()] = Vector2(512, 512)
         if "$basetexture" in mat:
@@ -105,33 +112,33 @@ def copyTextures(mats, dir: SourceDir, mdl=False):
         if "$bumpmap" in mat:
             bumpMap = mat["$bumpmap"].strip()
             name: str = newPath(splitext(bumpMap)[0], True)
-            dir.copy(f"materials/{bumpMap}.vtf", f"{tempDir}/{vtfDir}/{name}.vtf")
+            findTexture(bumpMap, name)
             res["normalMaps"].append(name)
         if "$envmapmask" in mat:
             envMap: str = mat["$envmapmask"].strip()
             name = splitext(newPath(envMap, True))[0]
-            dir.copy(f"materials/{envMap}.vtf", f"{tempDir}/{vtfDir}/{name}.vtf")
+            findTexture(envMap, name)
             res["envMaps"].append(name)
         if "$blendmodulatetexture" in mat:
             revealMap: str = mat["$blendmodulatetexture"].strip()
             name = newPath(splitext(revealMap)[0], True)
-            dir.copy(f"materials/{revealMap}.vtf", f"{tempDir}/{vtfDir}/{name}.vtf")
+            findTexture(revealMap, name)
             res["revealMaps"].append(name)
         if "$basetexture2" in mat:
             basetexture2 = mat["$basetexture2"].strip()
             name: str = newPath(splitext(basetexture2)[0], True)
-            dir.copy(f"materials/{basetexture2}.vtf", f"{tempDir}/{vtfDir}/{name}.vtf")
+            findTexture(basetexture2, name)
             res["colorMaps"].append(name)
-            res["sizes"][file.strip() + "_blend"] = getTexSize(f"{tempDir}/{vtfDir}/{name}.vtf")
+            sizes[file.strip() + "_blend"] = name
         if "$bumpmap2" in mat:
             bumpMap2 = mat["$bumpmap2"].strip()
             name: str = newPath(splitext(bumpMap2)[0], True)
-            dir.copy(f"materials/{bumpMap2}.vtf", f"{tempDir}/{vtfDir}/{name}.vtf")
+            findTexture(bumpMap2, name)
             res["normalMaps"].append(name)
         if "$envmapmask2" in mat:
             envMap2: str = mat["$envmapmask2"].strip()
             name = newPath(splitext(envMap2)[0], True)
-            dir.copy(f"materials/{envMap2}.vtf", f"{tempDir}/{vtfDir}/{name}.vtf")
+            findTexture(envMap2, name)
             res["envMaps"].append(name)
         if "$basealphaenvmapmask" in mat:
             res["envMapsAlpha"].append(newPath(splitext(mat["$basetexture"])[0], True))
@@ -141,37 +148,53 @@ def copyTextures(mats, dir: SourceDir, mdl=False):
             res["envMapsAlpha"].append(newPath(splitext(mat["$bumpmap"])[0], True))
         if "$normalmapalphaenvmapmask2" in mat and "$bumpmap2" in mat:
             res["envMapsAlpha"].append(newPath(splitext(mat["$bumpmap2"])[0], True))
+
+    # only the headers of the textures are needed for their sizes
+    textures = res["textures"]
+    files = dir.fetchAll([textures[name] for name in sizes.values() if name in textures], size=HEADER_SIZE)
+    for key, name in sizes.items():
+        res["sizes"][key] = getTexSize(files[textures[name]] if name in textures else None)
     return res
 
-def copyModels(models, dir: SourceDir):
-    total = len(models)
-    for i, model in enumerate(models):
-        print(f"{i}|{total}|done", end="")
+# reads the mdl, vtx and vvd files of each model, the returned models are shared by the material and model conversion
+def copyModels(models, dir: SourceDir) -> Dict[str, SourceModel]:
+    paths = {}
+    for model in models:
         modelName = splitext(basename(model))[0]
         newName = splitext(newPath(model))[0]
         path = dirname(model)
-        dir.copy(f"{model}", f"{tempDir}/mdl/{newName}.mdl")
+        paths[newName] = {"mdl": model}
         for ext in ["dx90.vtx", "vtx", "vvd"]:
-            dir.copy(f"{path}/{modelName}.{ext}", f"{tempDir}/mdl/{newName}.{ext}", True)
+            paths[newName][ext] = f"{path}/{modelName}.{ext}"
+
+    # only the missing mdl files are worth mentioning, the others are optional
+    for exts in paths.values():
+        if not dir.exists(exts["mdl"]):
+            print(f"Could not find file {exts['mdl']}")
+    files = dir.fetchAll([path for exts in paths.values() for path in exts.values()], True)
+
+    return {
+        name: SourceModel(name, {ext: files[path] for ext, path in exts.items() if files[path] is not None})
+        for name, exts in paths.items()
+    }
 
-def copyModelMaterials(models, dir: SourceDir, modelTints, skinTints, game="WaW"):
+# returns the text of each model material, including the tinted copies of them
+def copyModelMaterials(models: Dict[str, SourceModel], dir: SourceDir, modelTints, skinTints, game="WaW") -> Dict[str, str]:
     materials = []
-    res = []
+    res = {}
     total = len(models)
     
-    for i, model in enumerate(models):
+    for i, (mdlName, model) in enumerate(models.items()):
         print(f"{i}|{total}|done", end="")
-        mdlName = splitext(newPath(model))[0]
         tints = modelTints[mdlName] if mdlName in modelTints else []
         
         if mdlName in skinTints:
             for _, _tints in skinTints[mdlName].items():
                 tints += _tints
         
-        if not exists(f"{tempDir}/mdl/{mdlName}.mdl"):
+        if not model.readMdl():
             continue
-        mdl = Mdl(f"{tempDir}/mdl/{mdlName}.mdl")
-        mdl.read()
+        mdl = model.mdl
 
         for material in mdl.materials:
             for path in mdl.materials_paths:
@@ -185,35 +208,24 @@ def copyModelMaterials(models, dir: SourceDir, modelTints, skinTints, game="WaW"
                 if name not in materials:
                     materials.append((name, mdl.header.surface_prop, tints))
 
-    total = len(materials)
-    for i, (mat, surface_prop, tints) in enumerate(materials):
-        print(f"{i}|{total}|done", end="")
+    files = dir.fetchAll([f"materials/{mat}.vmt" for mat, _, _ in materials], True)
+    for mat, surface_prop, tints in materials:
         name = newPath(mat)
-        if dir.copy(f"materials/{mat}.vmt", f"{tempDir}/mdlMats/{name}.vmt", True):
+        vmt = decodeText(files[f"materials/{mat}.vmt"])
+        if vmt is not None:
             # unlike CoD, the surface type of a model isn't defined in the material so we have to copy that value
             # from the model and paste it in the materials it uses
-            try:
-                file = open(f"{tempDir}/mdlMats/{name}.vmt")
-                new = file.read().replace("{\n", f'{{\n"$surfaceprop" "{surface_prop}"\n', 1)
-                open(f"{tempDir}/mdlMats/{name}.vmt", "w").write(new)
-            except:
-                pass
-            res.append(name)
+            vmt = vmt.replace("{\n", f'{{\n"$surfaceprop" "{surface_prop}"\n', 1)
+            res[name] = vmt
 
             # create new a material for each tint value used for the model
             if game == "BO3" and len(tints) > 0:
                 for tint in tints:
                     hex = Vector3.FromStr(tint).toHex()
                     tint = (Vector3.FromStr(tint) / 255).round(3)
-                    try:
-                        file = open(f"{tempDir}/mdlMats/{name}.vmt")
-                        new = file.read().replace("{\n", f'{{\n"$colortint" "{tint} 1"\n', 1)
-                        open(f"{tempDir}/mdlMats/{name}_{hex}.vmt", "w").write(new)
-                        res.append(f"{name}_{hex}")
-                    except:
-                        pass
+                    res[f"{name}_{hex}"] = vmt.replace("{\n", f'{{\n"$colortint" "{tint} 1"\n', 1)
 
-    return sorted(set(res))
+    return dict(sorted(res.items()))
 
 def surfaceType(surface: str, game=""):
     surface = surface.lower()
@@ -342,14 +354,14 @@ def surfaceType(surface: str, game=""):
             "glossrange": (0, 4)
         }
     
-def createMaterialGdt(vmts: dict, game="WaW"):
+def createMaterialGdt(vmts: dict, textures: dict, game="WaW"):
     if game == "BO3":
-        return createMaterialGdtBo3(vmts)
+        return createMaterialGdtBo3(vmts, textures)
     gdt = Gdt()
     textureDir = "texture_assets\\\\corvid\\\\"
     ext, _ext = ".tga", "_.tga"
 
-    fileList = listdir(f"{tempDir}/matTex") + listdir(f"{tempDir}/mdlTex")
+    fileList = [f"{name}.vtf" for name in textures]
 
     total = len(vmts.items())
 
@@ -464,10 +476,10 @@ def createMaterialGdt(vmts: dict, game="WaW"):
         gdt.add(assetName.strip(), "material", data)
     return gdt
 
-def createMaterialGdtBo3(vmts: dict):
+def createMaterialGdtBo3(vmts: dict, textures: dict):
     gdt = Gdt()
     total = len(vmts.items())
-    fileList = listdir(f"{tempDir}/matTex") + listdir(f"{tempDir}/mdlTex")
+    fileList = [f"{name}.vtf" for name in textures]
 
     for i, (name, vmt) in enumerate(vmts.items()):
         print(f"{i}|{total}|done", end="")
@@ -792,11 +804,13 @@ def exportSkybox(skyName: str, mapName: str, worldSpawnSettings, dir: SourceDir,
     gdt = Gdt()
     ext = "tif" if game == "BO3" else "tga"
     convertDir = f"{tempDir}/converted/texture_assets/corvid/"
+    # the converted sides are kept in memory for the equirectangular sky of bo3
+    images = {}
 
     for face in faces:
         name = f"{mapName}_sky_{face}"
-        if dir.copy(f"materials/skybox/{skyName}{face}.vmt", f"{tempDir}/mat/{name}.vmt"):
-            vmt = fixVmt(open(f"{tempDir}/mat/{name}.vmt").read())
+        vmt = dir.open(f"materials/skybox/{skyName}{face}.vmt", False)
+        if vmt is not None:
             vmt = parse_vdf(fixVmt(vmt))
             shader = list(vmt)[0]
             mat = vmt[shader]
@@ -806,48 +820,30 @@ def exportSkybox(skyName: str, mapName: str, worldSpawnSettings, dir: SourceDir,
                     texture = param
                     break
             texture = splitext(basename(mat[texture]))[0]
-            dir.copy(f"materials/skybox/{texture}.vtf", f"{tempDir}/matTex/{name}.vtf")
-            convertImage(f"{tempDir}/matTex/{name}.vtf", f"{convertDir}/{name}.{ext}", format="rgb", resize=True)
+            images[face] = convertImage(dir.read(f"materials/skybox/{texture}.vtf"), f"{convertDir}/{name}.{ext}", format="rgb", resize=True)
         else:
             return gdt # return an empty gdt in case the sky materials can't be found
 
     if game == "BO3":
         print("Converting skybox...")
-        # load all sides of the cubemap
-        images = {}
-        for face in faces:
-            if not exists(f"{convertDir}/{mapName}_sky_{face}.tif"):
-                return gdt
-            images[face] = Image.open(f"{convertDir}/{mapName}_sky_{face}.tif").resize((1024, 1024))
-        
-        # create an empty image and paste all sides in it
-        cubemap = Image.new(mode="RGB", size=(4096, 3072), color=(255, 255, 255))
+        if None in images.values():
+            return gdt
+        images = {face: np.asarray(image.convert("RGB").resize((1024, 1024))) for face, image in images.items()}
 
-        # rt ft lf bk
-        # bk rt ft lf
-
-        cubemap.paste(images["bk"], (0, 1024))
-        cubemap.paste(images["rt"], (1024, 1024))
-        cubemap.paste(images["up"], (1024, 0))
-        cubemap.paste(images["ft"], (2048, 1024))
-        cubemap.paste(images["lf"], (3072, 1024))
-        cubemap.paste(images["dn"], (1024, 2048))
-        cubemap.save(f"{convertDir}/cubemap.tif")
-
-        # create an equirectangular image from the new cubemap image
+        # create an equirectangular image straight from the sides of the cubemap
         # based on https://github.com/adamb70/Python-Spherical-Projection/blob/master/Example/Example%201/SingleExample.py
-        wo, ho = cubemap.size
-
-        h = int(wo / 3)
-        w = int(2 * h)
-        n = ho / 3
-
-        res = Image.new(mode="RGB", size=(w, h), color=(0, 255, 239))
-
-        for ycoord in range(0, h):
-            for xcoord in range(0, w):
-                corrx, corry = find_corresponding_pixel(xcoord, ycoord, w, h, n)
-                res.putpixel((xcoord, ycoord), cubemap.getpixel((corrx, corry)))
+        n = 1024
+        h = int(4 * n / 3)
+        w = 2 * h
+
+        res = Image.fromarray(convert_cubemap({
+            FACE_X_NEG: images["rt"],
+            FACE_X_POS: images["lf"],
+            FACE_Z_NEG: images["ft"],
+            FACE_Z_POS: images["bk"],
+            FACE_Y_POS: images["up"],
+            FACE_Y_NEG: images["dn"]
+        }, w, h))
 
         res.save(f"{convertDir}/i_{mapName}_sky.tif")
 
@@ -951,9 +947,6 @@ def exportMinimap(mapName: str, dir: SourceDir, game="WaW"):
     if overview is None:
         return None, None, None
     
-    if isinstance(overview, bytes): # it's from a vpk
-        overview = overview.decode("ascii")
-    
     overview = fixVmt(overview)
 
     data = parse_vdf(overview)
@@ -963,25 +956,32 @@ def exportMinimap(mapName: str, dir: SourceDir, game="WaW"):
         return None, None, None
     
     image: Image
+    dest = f"{tempDir}/converted/texture_assets/corvid/{mapName}_radar.{ext}"
     # csgo uses dds images for radars whereas older games use vtf images
-    if dir.copy(f"resource/overviews/{data['material']}_radar.dds", f"{tempDir}/matTex/{mapName}_radar.dds", silent=True):
-        Image.open(f"{tempDir}/matTex/{mapName}_radar.dds").save(f"{tempDir}/converted/texture_assets/corvid/{mapName}/{mapName}_radar.{ext}", silent=True)
-    elif dir.copy(f"materials/{data['material']}_radar.vmt", f"{tempDir}/mat/{mapName}_radar.vmt"):
-        mat = parse_vdf(fixVmt(open(f"{tempDir}/mat/{mapName}_radar.vmt").read()))
+    dds = dir.read(f"resource/overviews/{data['material']}_radar.dds", silent=True)
+    if dds is not None:
+        image = Image.open(BytesIO(dds))
+    else:
+        vmt = dir.open(f"materials/{data['material']}_radar.vmt", False)
+        if vmt is None:
+            return None, None, None
+        mat = parse_vdf(fixVmt(vmt))
         mat = mat[list(mat)[0]]
+        vtf = None
         if "$basetexture" in mat:
-            if not dir.copy("materials/" + mat["$basetexture"] + ".vtf", f"{tempDir}/matTex/{mapName}_radar.vtf", silent=True):
+            vtf = dir.read("materials/" + mat["$basetexture"] + ".vtf", silent=True)
+            if vtf is None:
                 return None, None, None
-        convertImage(f"{tempDir}/matTex/{mapName}_radar.vtf", f"{tempDir}/converted/texture_assets/corvid/{mapName}_radar.{ext}",  "rgb")
-    else:
-        return None, None, None
-
-    image = Image.open(f"{tempDir}/converted/texture_assets/corvid/{mapName}_radar.{ext}")
+        image = convertImage(vtf, dest, "rgb")
+        if image is None:
+            return None, None, None
 
+    # the converted vtf is already saved, it only needs to be saved again if it's rotated
     if "rotate" in data and data["rotate"] != "1":
         image = image.rotate(90)
-    
-    image.save(f"{tempDir}/converted/texture_assets/corvid/{mapName}_radar.{ext}")
+        image.save(dest)
+    elif dds is not None:
+        image.save(dest)
 
     if game == "BO3":
         gdt.add(f"i_{mapName}_minimap", "image",{
@@ -1,34 +1,39 @@
 from .Vector3 import Vector3
 from .Side import Side
 from .AABB import AABB
-from math import isnan
-
-def getPlaneIntersection(side1: Side, side2: Side, side3: Side) -> Vector3:
-    normal1: Vector3 = side1.normal().normalize()
-    normal2: Vector3 = side2.normal().normalize()
-    normal3: Vector3 = side3.normal().normalize()
-    determinant = (
-        (
-            normal1.x * normal2.y * normal3.z +
-            normal1.y * normal2.z * normal3.x +
-            normal1.z * normal2.x * normal3.y
-        )
-        -
-        (
-            normal1.z * normal2.y * normal3.x +
-            normal1.y * normal2.x * normal3.z +
-            normal1.x * normal2.z * normal3.y
-        )
-    )
-    # can't intersect parallel planes
-    if abs(determinant) <= 1e-5 or (isnan(determinant)):
-        return None
-    else:
-        return (
-            normal2.cross(normal3) * side1.distance() +
-            normal3.cross(normal1) * side2.distance() +
-            normal1.cross(normal2) * side3.distance()
-        ) / determinant
+from itertools import combinations
+import numpy as np
+
+# solves every plane triple of a brush at once instead of going through them one by one
+# normals are expected to be normalized, centers are the centers of the three points that define each plane
+# returns the legal intersection points and the indices of the three sides each point belongs to
+def getPlaneIntersections(normals: np.ndarray, distances: np.ndarray, centers: np.ndarray):
+    if len(normals) < 3:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=int)
+
+    triples = np.array(list(combinations(range(len(normals)), 3)))
+    n1, n2, n3 = normals[triples[:, 0]], normals[triples[:, 1]], normals[triples[:, 2]]
+    n2xn3, n3xn1, n1xn2 = np.cross(n2, n3), np.cross(n3, n1), np.cross(n1, n2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        determinants = np.einsum("ij,ij->i", n1, n2xn3)
+
+        # can't intersect parallel planes
+        valid = np.abs(determinants) > 1e-5
+        triples, determinants = triples[valid], determinants[valid]
+
+        points = (
+            n2xn3[valid] * distances[triples[:, 0], None] +
+            n3xn1[valid] * distances[triples[:, 1], None] +
+            n1xn2[valid] * distances[triples[:, 2], None]
+        ) / determinants[:, None]
+
+        # a point is legal if it isn't behind any of the sides of the brush
+        facing = points @ normals.T - np.einsum("ij,ij->i", centers, normals)
+        facing /= np.linalg.norm(points[:, None, :] - centers[None, :, :], axis=2)
+        legal = ~(facing < -0.001).any(axis=1)
+
+    return points[legal], triples[legal]
 
 class Brush:
     def __init__(self, sides: list, entity: str = "world", id="0", entData={}):
@@ -44,17 +49,18 @@ class Brush:
 
     def getIntersectionPoints(self):
         n = len(self.sides)
-        for i in range(n - 2):
-            for j in range(n - 1):
-                for k in range(n):
-                    if i != j and i != k and j != k:
-                        intersectionPoint: Vector3 = getPlaneIntersection(
-                            self.sides[i], self.sides[j], self.sides[k]
-                        )
-                        if intersectionPoint is not None and intersectionPoint.isLegal(self.sides):
-                            self.sides[i].points.append(intersectionPoint)
-                            self.sides[j].points.append(intersectionPoint)
-                            self.sides[k].points.append(intersectionPoint)
+        planes = [side.plane for side in self.sides]
+        normals = np.array([(plane.normal.x, plane.normal.y, plane.normal.z) for plane in planes], dtype=float).reshape(-1, 3)
+        distances = np.array([plane.distance for plane in planes], dtype=float)
+        centers = np.array([(plane.center.x, plane.center.y, plane.center.z) for plane in planes], dtype=float).reshape(-1, 3)
+
+        points, owners = getPlaneIntersections(normals, distances, centers)
+
+        for point, (i, j, k) in zip(points.tolist(), owners.tolist()):
+            intersectionPoint = Vector3(point[0], point[1], point[2])
+            self.sides[i].points.append(intersectionPoint)
+            self.sides[j].points.append(intersectionPoint)
+            self.sides[k].points.append(intersectionPoint)
 
         for i in range(n):
             if len(self.sides[i].points) != 0:
@@ -93,7 +99,7 @@ class Brush:
 
         for side in self.sides:
             if side.IsTouching(box):
-                if side.normal().normalize().dot(box.center - side.p1) < 0: # if it's behind the side, we don't need it
+                if side.plane.normal.dot(box.center - side.p1) < 0: # if it's behind the side, we don't need it
                     continue
                 points.append(side.getClosestPoint(box.center))
         
@@ -101,4 +107,4 @@ class Brush:
             if point.isLegal(self.sides):
                 res.append(point)
         
-        return res
\ No newline at end of file
+        return res
\ No newline at end of file
@@ -0,0 +1,80 @@
+import pickle
+from hashlib import blake2b
+from os import getpid, makedirs, replace, stat
+from os.path import abspath, isfile, splitext
+from shutil import copyfile
+from tempfile import gettempdir
+from .Static import shortenPath
+
+# the corvid folder in temp is deleted every time the app starts, so anything that should last between conversions goes here
+cacheDir = f"{gettempdir()}/corvid_cache"
+
+# bump this whenever the format of the cached data or the way textures and models are converted changes
+VERSION = 2
+
+# files are identified by their full path, and they are considered unchanged as long as their size and modification time are the same
+def getKey(path: str):
+    info = stat(path)
+    return (VERSION, abspath(path), info.st_mtime_ns, info.st_size)
+
+def getIndexPath(path: str):
+    return f"{cacheDir}/index/{shortenPath(abspath(path).lower(), 8)}.pickle"
+
+# returns the cached index of an archive, or None if there isn't one or the archive has changed since it was cached
+def loadIndex(path: str):
+    try:
+        with open(getIndexPath(path), "rb") as file:
+            key, index = pickle.load(file)
+    except:
+        return None
+
+    return index if key == getKey(path) else None
+
+def saveIndex(path: str, index):
+    indexPath = getIndexPath(path)
+    try:
+        makedirs(f"{cacheDir}/index", exist_ok=True)
+        # write to a temporary file first so an interrupted write can't leave a broken cache behind
+        with open(indexPath + ".tmp", "wb") as file:
+            pickle.dump((getKey(path), index), file, pickle.HIGHEST_PROTOCOL)
+        replace(indexPath + ".tmp", indexPath)
+    except Exception as e:
+        print(f"Could not cache the index of {path}: {e}")
+
+# converted files are stored under a hash of their source data and the options they were converted with,
+# so they can be reused no matter which map or game folder the source came from
+def hashKey(data, *options) -> str:
+    hash = blake2b(digest_size=16)
+    # the data can be a list of buffers, like all the files of a model
+    for part in data if isinstance(data, list) else [data]:
+        hash.update(part)
+    hash.update(repr((VERSION,) + options).encode())
+    return hash.hexdigest()
+
+def getFilePath(kind: str, key: str, ext: str):
+    return f"{cacheDir}/{kind}/{key}{ext}"
+
+# copies a cached file to dest, the extension of dest is a part of the key
+# the files are copied instead of linked, the converted files get moved to the game folder
+# and anything that overwrites them there would overwrite the cached file as well
+def loadFile(kind: str, key: str, dest: str) -> bool:
+    path = getFilePath(kind, key, splitext(dest)[1])
+    if not isfile(path):
+        return False
+
+    try:
+        copyfile(path, dest)
+    except OSError:
+        return False
+    return True
+
+def saveFile(kind: str, key: str, src: str):
+    path = getFilePath(kind, key, splitext(src)[1])
+    try:
+        makedirs(f"{cacheDir}/{kind}", exist_ok=True)
+        # several processes can be converting the same file at once
+        temp = f"{path}.{getpid()}.tmp"
+        copyfile(src, temp)
+        replace(temp, path)
+    except Exception as e:
+        print(f"Could not cache {src}: {e}")
@@ -16,41 +16,25 @@ class Brush:
         self.layer = None
 
     def __str__(self) -> str:
-        res = "{\n"
+        res = ["{"]
 
         if self.layer is not None:
-            res += f"layer {self.layer}\n"
+            res.append(f"layer {self.layer}")
 
         if len(self.toolflags) > 0:
-            res += "toolFlags " + " ".join(self.toolflags) + ";\n"
+            res.append("toolFlags " + " ".join(self.toolflags) + ";")
 
         if len(self.contents) > 0:
-            res += "contents " + " ".join(self.contents) + ";\n"
+            res.append("contents " + " ".join(self.contents) + ";")
             
-        for face in self.faces:
-            res += str(face)
+        res.extend(str(face) for face in self.faces)
+        res.append("}\n")
 
-        res += "}\n"
-
-        return res
+        return "\n".join(res)
 
     def __repr__(self) -> str:
         address = "%.2x" % id(self)
         return f"<Brush object at {address}>"
     
     def Save(self, file: TextIOWrapper):
-        file.write("{\n")
-
-        if self.layer is not None:
-            file.write(f"layer {self.layer}\n")
-
-        if len(self.toolflags) > 0:
-            file.write("toolFlags " + " ".join(self.toolflags) + ";\n")
-
-        if len(self.contents) > 0:
-            file.write("contents " + " ".join(self.contents) + ";\n")
-            
-        for face in self.faces:
-            face.Save(file)
-
-        file.write("}\n")
+        file.write(str(self))
@@ -3,3 +3,4 @@ from .Brush import Brush
 from .Face import Face
 from .Patch import Patch, PatchVert
 from .Map import Map
+from .MapWriter import MapWriter
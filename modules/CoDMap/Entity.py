@@ -1,7 +1,7 @@
 from io import TextIOWrapper
 from typing import Dict, List, Union
 
-from modules.Static import flatten
+from modules.Static import flatten, iterFlatten
 from .Brush import Brush
 from .Patch import Patch
 
@@ -59,9 +59,7 @@ class Entity:
         for key, value in self.properties.items():
             file.write(f'"{key}" "{value}"\n')
 
-        self.geo = flatten(self.geo)
-
-        for i, geo in enumerate(self.geo):
+        for i, geo in enumerate(iterFlatten(self.geo)):
             if geo is not None:
                 file.write(f"// brush {i}\n")
                 geo.Save(file)
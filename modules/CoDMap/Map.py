@@ -6,6 +6,7 @@ from modules.Static import flatten
 from .Entity import Entity
 from .Face import Face
 from .Patch import Patch
+from .MapWriter import MapWriter
 
 class Map:
     flags: List['str']
@@ -116,17 +117,5 @@ class Map:
         return res
     
     def Save(self, file: TextIOWrapper):
-        file.write("iwmap 4\n")
-
-        for flag in self.flags:
-            file.write(flag + "\n")
-        
-        self.entities = flatten(self.entities)
-
-        for i, entity in enumerate(self.entities):
-            if entity is None:
-                continue
-
-            file.write(f"// entity {i}\n")
-            entity.Save(file)
+        MapWriter(file).writeMap(self)
     
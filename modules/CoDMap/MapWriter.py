@@ -0,0 +1,78 @@
+from io import TextIOWrapper
+from typing import Dict, List
+from modules.Static import iterFlatten
+from .Entity import Entity
+
+class MapWriter:
+    file: TextIOWrapper
+    buffer: List[str]
+    bufferSize: int
+    size: int
+    entityCount: int
+    geoCount: int
+
+    # entities and geo are collected in a buffer and written in big chunks instead of line by line
+    # the entities can be written as a whole or piece by piece with beginEntity, writeGeo and endEntity
+    def __init__(self, file: TextIOWrapper, bufferSize=2**20) -> None:
+        self.file = file
+        self.buffer = []
+        self.bufferSize = bufferSize
+        self.size = 0
+        self.entityCount = 0
+        self.geoCount = 0
+
+    def write(self, text: str):
+        self.buffer.append(text)
+        self.size += len(text)
+
+        if self.size >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        self.file.write("".join(self.buffer))
+        self.buffer = []
+        self.size = 0
+
+    def writeHeader(self, flags: List[str]=[]):
+        self.write("iwmap 4\n" + "".join(flag + "\n" for flag in flags))
+
+    def beginEntity(self, properties: Dict[str, str], layer: str=None):
+        self.geoCount = 0
+        self.write(
+            f"// entity {self.entityCount}\n{{\n"
+            + (f"layer {layer}\n" if layer is not None else "")
+            + "".join(f'"{key}" "{value}"\n' for key, value in properties.items())
+        )
+
+    # geo can be a brush, a patch or a (nested) list of them, empty geo still takes up a number
+    def writeGeo(self, geo):
+        for item in iterFlatten(geo if isinstance(geo, list) else [geo]):
+            if item is not None:
+                self.write(f"// brush {self.geoCount}\n{item}")
+            self.geoCount += 1
+
+    def endEntity(self):
+        self.write("}\n")
+        self.entityCount += 1
+
+    # entities that couldn't be converted still take up a number
+    def skipEntity(self):
+        self.entityCount += 1
+
+    def writeEntity(self, entity: Entity):
+        if entity is None:
+            self.skipEntity()
+            return
+
+        self.beginEntity(entity.properties, entity.layer)
+        self.writeGeo(entity.geo)
+        self.endEntity()
+
+    def writeEntities(self, entities: List[Entity]):
+        for entity in iterFlatten(entities):
+            self.writeEntity(entity)
+
+    def writeMap(self, codMap):
+        self.writeHeader(codMap.flags)
+        self.writeEntities(codMap.entities)
+        self.flush()
@@ -22,14 +22,16 @@ class PatchVert:
         self.lm = lm
         self.nolightmap = False
     
+    # the values are formatted directly instead of going through the __str__ of each vector
     def __str__(self) -> str:
+        pos, uv, lm = self.pos, self.uv, self.lm
         if self.nolightmap:
             if self.color == None:
-                return f"v {self.pos} t {self.uv}"
+                return "v %g %g %g t %g %g" % (pos.x, pos.y, pos.z, uv.x, uv.y)
             return f"v {self.pos} c {self.color} t {self.uv}"
         elif self.color == None:
-            return f"v {self.pos} t {self.uv} {self.lm}"
-        return f"v {self.pos} c {Color2Str(self.color)} t {self.uv} {self.lm}"
+            return "v %g %g %g t %g %g %g %g" % (pos.x, pos.y, pos.z, uv.x, uv.y, lm.x, lm.y)
+        return "v %g %g %g c %i %i %i %i t %g %g %g %g" % (pos.x, pos.y, pos.z, *self.color, uv.x, uv.y, lm.x, lm.y)
     
     def Save(self, file: TextIOWrapper):
         file.write(str(self) + "\n")
@@ -111,51 +113,39 @@ class Patch:
 
         return tris
 
-    def __str__(self) -> str:            
-        res = (
-            "{\n"
-            + self.type + "\n"
-            + "{\n"
-            + (f"contents {' '.join([content for content in self.contents])};\n" if len(self.contents) != 0 else "")
-            + (f"toolFlags {' '.join([flag for flag in self.toolflags])};\n" if len(self.toolflags) != 0 else "")
-            + self.texture + "\n"
-            + self.lightmap + "\n"
-            + (f"smoothing {self.smoothing}\n" if self.smoothing is not None else "")
-            + f"{self.size[0]} {self.size[1]} {self.samplesize} 8\n"
-        )
+    # the whole patch is built as a list of lines and joined once
+    def __str__(self) -> str:
+        res = [
+            "{",
+            self.type,
+            "{"
+        ]
 
-        for row in self.verts:
-            res += "(\n"
+        if len(self.contents) != 0:
+            res.append(f"contents {' '.join(self.contents)};")
+        if len(self.toolflags) != 0:
+            res.append(f"toolFlags {' '.join(self.toolflags)};")
 
-            for vert in row:
-                vert.nolightmap = self.nolightmap
-                res += str(vert) + "\n"
+        res.append(self.texture)
+        res.append(self.lightmap)
 
-            res += ")\n"
+        if self.smoothing is not None:
+            res.append(f"smoothing {self.smoothing}")
 
-        res += "}\n"
-        res += "}\n"
-        return res
-    
-    def Save(self, file: TextIOWrapper):
-        file.write("{\n")
-        file.write(self.type + "\n")
-        file.write("{\n")
-        file.write((f"contents {' '.join([content for content in self.contents])};\n" if len(self.contents) != 0 else ""))
-        file.write((f"toolFlags {' '.join([flag for flag in self.toolflags])};\n" if len(self.toolflags) != 0 else ""))
-        file.write(self.texture + "\n")
-        file.write(self.lightmap + "\n")
-        file.write((f"smoothing {self.smoothing}\n" if self.smoothing is not None else ""))
-        file.write(f"{self.size[0]} {self.size[1]} {self.samplesize} 8\n")
+        res.append(f"{self.size[0]} {self.size[1]} {self.samplesize} 8")
 
         for row in self.verts:
-            file.write("(\n")
+            res.append("(")
 
             for vert in row:
                 vert.nolightmap = self.nolightmap
-                vert.Save(file)
+            res.extend(map(str, row))
 
-            file.write(")\n")
+            res.append(")")
 
-        file.write("}\n")
-        file.write("}\n")
+        res.append("}")
+        res.append("}\n")
+        return "\n".join(res)
+    
+    def Save(self, file: TextIOWrapper):
+        file.write(str(self))
@@ -61,9 +61,9 @@ def ProjectDecal(decal: AABB, side: Side, material: str, size: Vector2):
         center + Vector((size.x / 2, size.y / 2, 0)),
     ]
 
-    normal = side.normal().normalize().ToBpy()
+    normal = side.plane.normal.ToBpy()
     quat = normal.to_track_quat('Z', 'Y')
     mat = quat.to_matrix().to_4x4()
-    mat.translation = side.center().ToBpy()
+    mat.translation = side.plane.center.ToBpy()
 
     return [mat @ point for point in points]
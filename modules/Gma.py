@@ -1,6 +1,8 @@
 # based on https://github.com/TheClonerx/py-gmav/blob/master/addon.py
 
 import json
+from mmap import mmap, ACCESS_READ
+from .Cache import loadIndex, saveIndex
 
 MAX_VER = 3
 
@@ -12,24 +14,21 @@ class FileEntry:
         self.CRC  = 0
         self.offset = 0
 
+    # the entry is a slice of the mapped addon, so reading it doesn't copy anything and can be done from any thread
+    def read(self):
+        start = self.addon.file_block + self.offset
+        return self.addon.view[start:start + self.size]
+
     def save(self, path):
-        block_size = 2**12
-        written = 0
-        self.addon.file.seek(self.addon.file_block)
-        self.addon.file.seek(self.offset, 1)
         with open(path, "wb") as file:
-            while written < self.size:
-                if block_size > self.size - written:
-                    block_size = self.size - written
-                file.write(self.addon.file.read(block_size))
-                written += block_size
-
-    # TODO: write a method to open files directly from addons
+            file.write(self.read())
 
 class Addon:
     def __init__(self, path):
         self.path = path
-        self.file = None
+        self.data = None
+        self.view = None
+        self.pos = 0
         self.format_ver = 0
         self.name    = ""
         self.desc    = ""
@@ -42,7 +41,10 @@ class Addon:
         self.entries: dict[str, FileEntry] = {}
 
     def open(self):
-        self.file = open(self.path, "rb")
+        with open(self.path, "rb") as file:
+            # empty files can't be mapped, check_file rejects them anyway
+            self.data = mmap(file.fileno(), 0, access=ACCESS_READ) if file.seek(0, 2) > 0 else b""
+        self.view = memoryview(self.data)
 
     def check_file(self):
         gmad = self.read_buff(4)
@@ -84,12 +86,36 @@ class Addon:
             offset += entry.size
             self.entries[entry.name] = entry
 
-        self.file_block = self.file.tell()
+        self.file_block = self.pos
+
+    # everything read from the header, so the addon can be loaded without parsing it again
+    def get_index(self):
+        return {
+            "format_ver": self.format_ver,
+            "name": self.name,
+            "desc": self.desc,
+            "type": self.type,
+            "tags": self.tags,
+            "author": self.author,
+            "version": self.version,
+            "file_block": self.file_block,
+            "entries": [(entry.name, entry.size, entry.CRC, entry.offset) for entry in self.entries.values()]
+        }
+
+    def set_index(self, index):
+        for key in ("format_ver", "name", "desc", "type", "tags", "author", "version", "file_block"):
+            setattr(self, key, index[key])
+
+        for name, size, CRC, offset in index["entries"]:
+            entry = FileEntry(self)
+            entry.name, entry.size, entry.CRC, entry.offset = name, size, CRC, offset
+            self.entries[name] = entry
 
     def read_buff(self, size):
-        buff = self.file.read(size)
+        buff = self.data[self.pos:self.pos + size]
         if len(buff) != size:
             raise ValueError("readed %d instead of %s" % (len(buff), size))
+        self.pos += size
         return buff
 
     def read_int(self, size, signed = False):
@@ -97,18 +123,25 @@ class Addon:
         return int.from_bytes(buff, "little", signed = signed)
 
     def read_str(self):
-        buff = b""
-        c = self.file.read(1)
-        while c != b"\0":
-            buff += c
-            c = self.file.read(1)
+        end = self.data.find(b"\0", self.pos)
+        if end == -1:
+            raise ValueError("unterminated string at %d" % self.pos)
+        buff = self.data[self.pos:end]
+        self.pos = end + 1
         return buff.decode()
 
 def load(path):
     addon = Addon(path)
     addon.open()
+
+    index = loadIndex(path)
+    if index is not None:
+        addon.set_index(index)
+        return addon
+
     if not addon.check_file():
         raise TypeError("wrong file type")
     addon.parse()
     addon.get_entries()
+    saveIndex(path, addon.get_index())
     return addon
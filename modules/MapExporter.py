@@ -1,7 +1,9 @@
 from io import TextIOWrapper
 from math import sin, cos
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Union
 from numpy import append
+import numpy as np
 from modules.Brush import Brush
 from .Decal import *
 from modules.Overlay import Overlay
@@ -58,15 +60,13 @@ def convertSide(side: Side, matSize, origin=Vector3.Zero(), scale=1):
     return res
 
 
-def getDispPoints(p1: Vector3, p2: Vector3, uv1: Vector2, uv2: Vector2, power: int):
-    res = []
-    rowCount = int(2 ** power) + 1
-    for i in range(rowCount):
-        res.append((
-            p1.lerp(p2, 1 / (rowCount - 1) * i), # pos
-            uv1.lerp(uv2, 1 / (rowCount - 1) * i), # uv
-        ))
-    return res
+# returns the values at the corners of a displacement interpolated over a grid with the shape (numVerts, numVerts, ...)
+# a, b, c and d are the corners in the same order as the points of the side
+def getDispGrid(a: np.ndarray, b: np.ndarray, c: np.ndarray, d: np.ndarray, numVerts: int) -> np.ndarray:
+    t = (np.arange(numVerts) / (numVerts - 1))[:, None]
+    ab = a + (b - a) * t
+    dc = d + (c - d) * t
+    return ab[:, None] + (dc - ab)[:, None] * t[None]
 
 def convertDisplacement(side: Side, matSize, origin=Vector3.Zero(), scale=1, game="WaW"):
     points = side.points
@@ -97,68 +97,51 @@ def convertDisplacement(side: Side, matSize, origin=Vector3.Zero(), scale=1, gam
             s = i
             break
 
-    a, UVa = points[s], uvs[s]
-    b, UVb = points[(s + 1) % 4], uvs[(s + 1) % 4]
-    c, UVc = points[(s + 2) % 4], uvs[(s + 2) % 4]
-    d, UVd = points[(s + 3) % 4], uvs[(s + 3) % 4]
+    # build the whole grid at once, vertex [i][j] of the patch uses the value at [j][i] in the displacement rows
+    corners = [(s + i) % 4 for i in range(4)]
+    pos = getDispGrid(*[np.array((points[i].x, points[i].y, points[i].z)) for i in corners], numVerts)
+    uv = getDispGrid(*[np.array((uvs[i].x, uvs[i].y)) for i in corners], numVerts)
 
-    ab = getDispPoints(a, b, UVa, UVb, power)
-    dc = getDispPoints(d, c, UVd, UVc, power)
+    normals = disp["normals"].transpose(1, 0, 2)
+    distances = disp["distances"].T
+    alphas = disp["alphas"].T
 
-    rows = []
-    for i in range(len(ab)):
-        rows.append(
-            getDispPoints(ab[i][0], dc[i][0], ab[i][1], dc[i][1], power))
+    if isinstance(origin, Vector3):
+        origin = np.array((origin.x, origin.y, origin.z))
+    if isinstance(scale, Vector3):
+        scale = np.array((scale.x, scale.y, scale.z))
 
-    alpha = False
+    positions = ((pos + np.array((0, 0, disp["elevation"])) + normals * distances[..., None]) - origin) * scale
+    texCoords = uv * np.array((side.texSize.x, side.texSize.y))
+    lmapCoords = side.getLmapUVs(pos)
 
-    res = cod.Patch(texture=material, size=(len(rows[0]), len(rows[0])))
+    # the patches are built from plain lists as creating vectors from numpy scalars is slow
+    texCoords = [[Vector2(*uv) for uv in row] for row in texCoords.tolist()]
+    lmapCoords = [[Vector2(*uv) for uv in row] for row in lmapCoords.tolist()]
 
-    for i in range(numVerts):
-        row = rows[i]
-        res.verts.append([])
+    res = cod.Patch(texture=material, size=(numVerts, numVerts))
 
-        for j in range(numVerts):
-            if disp["row"][j]["alphas"][i] != 0 and alpha != True:
-                    alpha = True
-            
-            pos, uv = row[j]
-
-            res.verts[-1].append(
-                cod.PatchVert(
-                    ((pos + Vector3(0, 0, disp["elevation"]) + (disp["row"][j]["normals"][i] * disp["row"][j]["distances"][i])) - origin) * scale,
-                    (uv * side.texSize) * 1,
-                    side.getLmapUV(pos)
-                )
-            )
+    for i, row in enumerate(positions.tolist()):
+        res.verts.append([cod.PatchVert(Vector3(*p), texCoords[i][j], lmapCoords[i][j]) for j, p in enumerate(row)])
     
     if res.size[0] == (game == "CoD4" or game == "CoD2") and numVerts == 17:
         res = res.Slice(9)
 
-    if not alpha or material + "_blend" not in matSize:
+    if not alphas.any() or material + "_blend" not in matSize:
         return res
 
-    offset = Vector3.Zero()
+    offset = np.zeros(3)
     if game == "WaW":
-        offset = side.normal().normalize() * 0.5
+        normal = side.plane.normal * 0.5
+        offset = np.array((normal.x, normal.y, normal.z))
     
-    res2 = cod.Patch(texture=material + "_blend", size=(len(rows[0]), len(rows[0])))
-
-    for i in range(numVerts):
-        row = rows[i]
-        res2.verts.append([])
-
-        for j in range(numVerts):
-            pos, uv = row[j]
-
-            res2.verts[-1].append(
-                cod.PatchVert(
-                    (((pos + Vector3(0, 0, disp["elevation"]) + (disp["row"][j]["normals"][i] * disp["row"][j]["distances"][i])) - origin) * scale) - offset,
-                    (uv * side.texSize) * 1,
-                    side.getLmapUV(pos),
-                    (255, 255, 255, disp["row"][j]["alphas"][i])
-                )
-            )
+    res2 = cod.Patch(texture=material + "_blend", size=(numVerts, numVerts))
+
+    for i, (row, rowAlphas) in enumerate(zip((positions - offset).tolist(), alphas.tolist())):
+        res2.verts.append([
+            cod.PatchVert(Vector3(*p), texCoords[i][j], lmapCoords[i][j], (255, 255, 255, rowAlphas[j]))
+            for j, p in enumerate(row)
+        ])
     
     if res2.size[0] == (game == "CoD4" or game == "CoD2") and numVerts == 17:
         res2 = res2.Slice(9)
@@ -166,7 +149,13 @@ def convertDisplacement(side: Side, matSize, origin=Vector3.Zero(), scale=1, gam
     return [res, res2]
 
 
-def convertBrush(brush: Brush, world=True, game="WaW", mapName="", origin=Vector3.Zero(), scale=1, matSizes: dict={}, brushConversion=False, sideDict: dict={}, AABBmin: Vector3=Vector3.Zero(), AABBmax: Vector3=Vector3.Zero()):
+def convertBrush(brush: Brush, world=True, game="WaW", mapName="", origin=Vector3.Zero(), scale=1, matSizes: dict=None, brushConversion=False, sideDict: dict=None, AABBmin: Vector3=None, AABBmax: Vector3=None):
+    # these are filled while converting the brush, so they can't be shared between calls through default values
+    matSizes = {} if matSizes is None else matSizes
+    sideDict = {} if sideDict is None else sideDict
+    AABBmin = Vector3.Zero() if AABBmin is None else AABBmin
+    AABBmax = Vector3.Zero() if AABBmax is None else AABBmax
+
     tools = {
         "toolsnodraw": "caulk",
         "toolsclip": "clip", "toolsplayerclip": "clip", "toolsinvisible": "clip", "toolsnpcclip": "clip", "toolsgrenadeclip": "clip_missile",
@@ -243,7 +232,32 @@ def convertBrush(brush: Brush, world=True, game="WaW", mapName="", origin=Vector
         return resPatch
 
     return [cod.Brush(faces), resPatch]
-    
+
+# material sizes are sent to each worker process once instead of being pickled with every brush
+workerMatSizes: Dict[str, Vector2] = {}
+
+def initBrushWorker(matSizes: Dict[str, Vector2]):
+    global workerMatSizes
+    workerMatSizes = matSizes
+
+# converts a single brush with its own accumulators so it can run in a worker process
+# the bounding box and the uvs of the converted sides are merged back in the main process
+def convertBrushJob(job):
+    brush, kwargs = job
+    AABBmin, AABBmax, sideDict = Vector3.Zero(), Vector3.Zero(), {}
+    kwargs = {"matSizes": workerMatSizes, **kwargs}
+    geo = convertBrush(brush, sideDict=sideDict, AABBmin=AABBmin, AABBmax=AABBmax, **kwargs)
+    # the uvs of the sides are calculated on copies of them when this runs in a worker process
+    return geo, AABBmin, AABBmax, {id: side.uvs for id, side in sideDict.items()}
+
+# converts a list of brushes either one by one or across a process pool
+# results are always returned in the same order as the brushes
+def convertBrushes(brushes: List[Brush], pool: ProcessPoolExecutor=None, **kwargs):
+    jobs = ((brush, kwargs) for brush in brushes)
+    if pool is None:
+        return map(convertBrushJob, jobs)
+    return pool.map(convertBrushJob, jobs, chunksize=32)
+
 def convertLight(entity, scale=1.0):
     if "_light" in entity:
         _color = [float(i) for i in entity["_light"].split(" ")]
@@ -266,6 +280,22 @@ def convertLight(entity, scale=1.0):
         "intensity": "1"
     })
 
+# light_environment entities are converted into worldspawn keys
+def convertLightEnvironment(entity, worldSpawnSettings: dict):
+    sundirection = Vector3.FromStr(entity["angles"])
+    sundirection.x = float(entity["pitch"])
+    sundirection.y = sundirection.y - 180 if sundirection.y >= 180 else sundirection.y + 180
+    worldSpawnSettings["sundirection"] = sundirection
+    worldSpawnSettings["sunlight"] = "1"
+    worldSpawnSettings["sundiffusecolor"] = "0.75 0.82 0.85"
+    worldSpawnSettings["diffusefraction"] = ".2"
+    worldSpawnSettings["ambient"] = ".116"
+    worldSpawnSettings["reflection_ignore_portals"] = "1"
+    if "ambient" in entity:
+        worldSpawnSettings["_color"] = Vector3.FromStr(entity["_ambient"] if "_ambient" in entity else entity["ambient"]) / 255
+    if "_light" in entity:
+        worldSpawnSettings["suncolor"] = Vector3.FromStr(entity["_light"]) / 255
+
 def convertSpotLight(entity, game="WaW", scale=1.0):
     if "_light" in entity:
         _color = [i for i in entity["_light"].split(" ") if i != ""]
@@ -768,20 +798,15 @@ def createSkyBrushes(AABBmin: Vector3, AABBmax: Vector3, mapName="", game="WaW")
     return sky, vol
 
 def exportMap(
-        vmfString, vpkFiles=[], gameDirs=[], game="WaW",
+        vmf, vpkFiles=[], gameDirs=[], game="WaW",
         skipMats=False, skipModels=False, mapName="",
-        brushConversion=False, scale=1.0, file: TextIOWrapper=None
+        brushConversion=False, scale=1.0, file: TextIOWrapper=None, workers=0
     ):
-    # create temporary directories to extract assets
+    # create the temporary directories the converted assets are written to
     copyDir = gettempdir() + "/corvid"
 
     if not exists(f"{copyDir}"):
         try:
-            makedirs(f"{copyDir}/mdl")
-            makedirs(f"{copyDir}/mat")
-            makedirs(f"{copyDir}/mdlMats")
-            makedirs(f"{copyDir}/matTex")
-            makedirs(f"{copyDir}/mdlTex")
             if game != "BO3":
                 makedirs(f"{copyDir}/converted/bin")
             makedirs(f"{copyDir}/converted/model_export/corvid")
@@ -790,7 +815,7 @@ def exportMap(
         except:
             pass
 
-    mapData = readMap(vmfString)
+    mapData = readMap(vmf)
 
     # load &/ define the paks and folders where the assets will be grabbed from
     gamePath = SourceDir()
@@ -812,10 +837,13 @@ def exportMap(
     # extract models, model materials and textures
     if not skipModels:
         print("Extracting models...")
-        copyModels(mapData["models"], gamePath)
+        sourceModels = copyModels(mapData["models"], gamePath)
         print("Loading model materials...")
-        mdlMaterials = copyModelMaterials(mapData["models"], gamePath, mapData["modelTints"], mapData["skinTints"], game)
+        mdlMaterials = copyModelMaterials(sourceModels, gamePath, mapData["modelTints"], mapData["skinTints"], game)
         mdlMatData = copyTextures(mdlMaterials, gamePath, True)
+        textures = {**matData["textures"], **mdlMatData["textures"]}
+    else:
+        textures = matData["textures"]
 
     # create GDT files
     gdtFile = Gdt()
@@ -829,12 +857,12 @@ def exportMap(
     if not skipMats or not skipModels:
         print("Generating GDT file...")
     if not skipMats:
-        worldMats = createMaterialGdt(matData["vmts"], game)
+        worldMats = createMaterialGdt(matData["vmts"], textures, game)
         gdtFile += worldMats
     if game != "BO3" and not skipMats:
         batFile += worldMats.toBat()
     if not skipModels:
-        modelMats = createMaterialGdt(mdlMatData["vmts"], game)
+        modelMats = createMaterialGdt(mdlMatData["vmts"], textures, game)
         gdtFile += modelMats
     if game != "BO3" and not skipModels:
         batFile += modelMats.toBat()
@@ -853,24 +881,68 @@ def exportMap(
     # convert the textures
     if not skipMats:
         print("Converting textures...")
-        convertImages(matData, "matTex", "texture_assets/corvid", "tif" if game == "BO3" else "tga")
+        convertImages(matData, gamePath, "texture_assets/corvid", "tif" if game == "BO3" else "tga", workers)
         if not skipModels:
-            convertImages(mdlMatData, "mdlTex", "texture_assets/corvid", "tif" if game == "BO3" else "tga")
+            convertImages(mdlMatData, gamePath, "texture_assets/corvid", "tif" if game == "BO3" else "tga", workers)
 
     # convert the models
     if not skipModels:
         print("Converting models...")
-        convertModels(mapData["models"], mapData["modelTints"], mapData["modelSkins"], mapData["skinTints"], game, scale)
+        convertModels(sourceModels, mdlMaterials, mapData["modelTints"], mapData["modelSkins"], mapData["skinTints"], game, scale)
 
     # generate map geometry
     print("Generating .map file...")
-    res = cod.Map()
-    world = cod.Entity({
-        "classname": "worldspawn"
-    })
-    res.entities.append(world)
 
+    # the map file is written while the geo is being converted, so the worldspawn keys need to be known before that
     worldSpawnSettings = {}
+    for entity in mapData["entities"]:
+        if entity["classname"] != "light_environment":
+            continue
+        try:
+            convertLightEnvironment(entity, worldSpawnSettings)
+        except Exception as e:
+            print(f"Could not convert the entity '{entity['classname']}' with the ID {entity['id']}. Skipping...")
+            print(f"Exception message:\n{e}")
+
+    flags = []
+    world = {
+        "classname": "worldspawn"
+    }
+
+    if game == "BO3":
+        flags.append('"script_startingnumber" 0\n')
+        flags.append('"000_Global" flags expanded  active\n')
+        flags.append('"000_Global/No Comp" flags hidden ignore \n')
+        flags.append('"The Map" flags expanded \n')
+
+        world.update({
+            "lightingquality": "1024",
+            "samplescale": "1",
+            "skyboxmodel": f"{mapName}_ssi",
+            "ssi": "default_day",
+            "wsi": "default_day",
+            "fsi": "default",
+            "gravity": "800",
+            "lodbias": "default",
+            "lutmaterial": "luts_t7_default",
+            "numOmniShadowSlices": "24",
+            "numSpotShadowSlices": "64",
+            "sky_intensity_factor0": "1",
+            "sky_intensity_factor1": "1",
+            "state_alias_1": "State 1",
+            "state_alias_2": "State 2",
+            "state_alias_3": "State 3",
+            "state_alias_4": "State 4"
+        })
+
+    else:
+        world.update(worldSpawnSettings)
+
+    # converted geo is written to the file right away, the other entities are kept until the worldspawn is closed
+    res = cod.MapWriter(file)
+    res.writeHeader(flags)
+    res.beginEntity(world)
+    mapEntities: List[cod.Entity] = []
 
     # store the furthest points for each axis to calculate the bounding box of the whole map
     AABBmin = Vector3.Zero()
@@ -899,91 +971,93 @@ def exportMap(
     bombsites = ["a", "b", "c", "d", "e", "f", "g"] # let's just make sure in case the maps has lots of bomb sites
     currentBombsite = 0 
 
-    # convert world geo & entities
-    for i, brush in enumerate(mapData["worldBrushes"]):
-        print(f"{i}|{total}|done", end="")
-        geo = convertBrush(brush, True, game, mapName, matSizes=matSizes, brushConversion=brushConversion, sideDict=sideDict, scale=scale, AABBmin=AABBmin, AABBmax=AABBmax)
-        if geo is not None:
-            world.geo.append(geo)
-
-        if not brush.isToolBrush and not brush.hasDisp:
-            brushDict[brush.id] = brush
-
-    for i, brush in enumerate(mapData["entityBrushes"], lenWorld):
-        print(f"{i}|{total}|done", end="")
-        geo = convertBrush(brush, False, game, mapName, matSizes=matSizes, sideDict=sideDict, scale=scale, AABBmin=AABBmin, AABBmax=AABBmax)
-        if geo is not None:
-            world.geo.append(geo)
-        
-        if not brush.isToolBrush and not brush.hasDisp:
-            brushDict[brush.id] = brush
+    # brushes can be converted in parallel since they don't depend on each other
+    initBrushWorker(matSizes)
+    pool = ProcessPoolExecutor(workers, initializer=initBrushWorker, initargs=(matSizes,)) if workers > 1 else None
+    # the workers are shut down even if the conversion fails, so they don't keep running in the background
+    try:
+        def addBrushGeo(brush: Brush, result):
+            geo, brushMin, brushMax, sideUvs = result
+            AABBmin.set(AABBmin.min(brushMin))
+            AABBmax.set(AABBmax.max(brushMax))
+            for side in brush.sides:
+                if side.id in sideUvs:
+                    side.uvs = sideUvs[side.id]
+                    sideDict[side.id] = side
+            if geo is not None:
+                res.writeGeo(geo)
+
+        # convert world geo & entities
+        worldGeo = convertBrushes(mapData["worldBrushes"], pool, world=True, game=game, mapName=mapName, brushConversion=brushConversion, scale=scale)
+        for i, (brush, result) in enumerate(zip(mapData["worldBrushes"], worldGeo)):
+            print(f"{i}|{total}|done", end="")
+            addBrushGeo(brush, result)
 
-    entities: Dict[str, str] = mapData["entities"]
-    for i, entity in enumerate(entities, lenWorld + lenEntBrushes):
-        if "origin" in entity:
-            origin = Vector3.FromStr(entity["origin"]) * scale
-            AABBmax.set(AABBmax.max(origin))
-            AABBmin.set(AABBmin.min(origin))
+            if not brush.isToolBrush and not brush.hasDisp:
+                brushDict[brush.id] = brush
 
-        try:
+        entityGeo = convertBrushes(mapData["entityBrushes"], pool, world=False, game=game, mapName=mapName, scale=scale)
+        for i, (brush, result) in enumerate(zip(mapData["entityBrushes"], entityGeo), lenWorld):
             print(f"{i}|{total}|done", end="")
-
-            if entity["classname"].startswith("prop_"):
-                res.entities.append(convertProp(entity, game, scale=scale))
-            elif entity["classname"] == "light":
-                res.entities.append(convertLight(entity, scale=scale))
-            elif entity["classname"] == "light_spot":
-                res.entities.append(convertSpotLight(entity, game, scale=scale))
-            elif entity["classname"] == "move_rope" or entity["classname"] == "keyframe_rope":
-                if game == "CoD4" or game == "CoD2":
-                    convertRope(entity, curve=True, ropeDict=ropeDict, scale=scale)
-                else:
-                    res.entities.append(convertRope(entity))
-            elif entity["classname"] == "env_cubemap":
-                if game == "CoD2" or game == "BO3":
-                    continue
-                res.entities.append(convertCubemap(entity, scale=scale))
-            elif entity["classname"].startswith("info_player") or entity["classname"].endswith("_spawn"):
-                res.entities.append(convertSpawner(entity, scale=scale))
-            # elif entity["classname"] == "info_overlay":
-            #     if entity["sides"] != "":
-            #         overlays.append(entity)
-            # elif entity["classname"] == "infodecal":
-            #     decals.append(entity)
-            elif entity["classname"] == "func_bomb_target":
-                res.entities.append(convertBombsite(entity, scale=scale, game=game, site=bombsites[currentBombsite]))
-                currentBombsite += 1
-            elif entity["classname"] == "light_environment":
-                sundirection = Vector3.FromStr(entity["angles"])
-                sundirection.x = float(entity["pitch"])
-                sundirection.y = sundirection.y - 180 if sundirection.y >= 180 else sundirection.y + 180
-                worldSpawnSettings["sundirection"] = sundirection
-                worldSpawnSettings["sunlight"] = "1"
-                worldSpawnSettings["sundiffusecolor"] = "0.75 0.82 0.85"
-                worldSpawnSettings["diffusefraction"] = ".2"
-                worldSpawnSettings["ambient"] = ".116"
-                worldSpawnSettings["reflection_ignore_portals"] = "1"
-                if "ambient" in entity:
-                    worldSpawnSettings["_color"] = Vector3.FromStr(entity["_ambient"] if "_ambient" in entity else entity["ambient"]) / 255
-                if "_light" in entity:
-                    worldSpawnSettings["suncolor"] = Vector3.FromStr(entity["_light"]) / 255
-        except Exception as e:
-            print(f"Could not convert the entity '{entity['classname']}' with the ID {entity['id']}. Skipping...")
-            print(f"Exception message:\n{e}")
-            pass
+            addBrushGeo(brush, result)
+        
+            if not brush.isToolBrush and not brush.hasDisp:
+                brushDict[brush.id] = brush
+
+        entities: Dict[str, str] = mapData["entities"]
+        for i, entity in enumerate(entities, lenWorld + lenEntBrushes):
+            if "origin" in entity:
+                origin = Vector3.FromStr(entity["origin"]) * scale
+                AABBmax.set(AABBmax.max(origin))
+                AABBmin.set(AABBmin.min(origin))
+
+            try:
+                print(f"{i}|{total}|done", end="")
+
+                if entity["classname"].startswith("prop_"):
+                    mapEntities.append(convertProp(entity, game, scale=scale))
+                elif entity["classname"] == "light":
+                    mapEntities.append(convertLight(entity, scale=scale))
+                elif entity["classname"] == "light_spot":
+                    mapEntities.append(convertSpotLight(entity, game, scale=scale))
+                elif entity["classname"] == "move_rope" or entity["classname"] == "keyframe_rope":
+                    if game == "CoD4" or game == "CoD2":
+                        convertRope(entity, curve=True, ropeDict=ropeDict, scale=scale)
+                    else:
+                        mapEntities.append(convertRope(entity))
+                elif entity["classname"] == "env_cubemap":
+                    if game == "CoD2" or game == "BO3":
+                        continue
+                    mapEntities.append(convertCubemap(entity, scale=scale))
+                elif entity["classname"].startswith("info_player") or entity["classname"].endswith("_spawn"):
+                    mapEntities.append(convertSpawner(entity, scale=scale))
+                # elif entity["classname"] == "info_overlay":
+                #     if entity["sides"] != "":
+                #         overlays.append(entity)
+                # elif entity["classname"] == "infodecal":
+                #     decals.append(entity)
+                elif entity["classname"] == "func_bomb_target":
+                    mapEntities.append(convertBombsite(entity, scale=scale, game=game, site=bombsites[currentBombsite]))
+                    currentBombsite += 1
+            except Exception as e:
+                print(f"Could not convert the entity '{entity['classname']}' with the ID {entity['id']}. Skipping...")
+                print(f"Exception message:\n{e}")
+                pass
             
-    # convert 3d skybox geo & entities
-    for i, brush in enumerate(mapData["skyBrushes"], lenWorld + lenEntBrushes + lenEnts):
-        print(f"{i}|{total}|done", end="")
-        geo = convertBrush(brush, True, game, mapName, origin=mapData["skyBoxOrigin"], scale=scale * mapData["skyBoxScale"], sideDict=sideDict, AABBmin=AABBmin, AABBmax=AABBmax)
-        if geo is not None:
-            world.geo.append(geo)
+        # convert 3d skybox geo & entities
+        # 3d skybox brushes have never used the texture sizes of the map, so they get an empty dictionary
+        skyGeo = convertBrushes(mapData["skyBrushes"], pool, world=True, game=game, mapName=mapName, origin=mapData["skyBoxOrigin"], scale=scale * mapData["skyBoxScale"], matSizes={})
+        for i, (brush, result) in enumerate(zip(mapData["skyBrushes"], skyGeo), lenWorld + lenEntBrushes + lenEnts):
+            print(f"{i}|{total}|done", end="")
+            addBrushGeo(brush, result)
 
-    for i, brush in enumerate(mapData["skyEntityBrushes"], lenWorld + lenEntBrushes + lenEnts + lenSky):
-        print(f"{i}|{total}|done", end="")
-        geo = convertBrush(brush, False, game, mapName, origin=mapData["skyBoxOrigin"], scale=scale * mapData["skyBoxScale"], sideDict=sideDict, AABBmin=AABBmin, AABBmax=AABBmax)
-        if geo is not None:
-            world.geo.append(geo)
+        skyEntityGeo = convertBrushes(mapData["skyEntityBrushes"], pool, world=False, game=game, mapName=mapName, origin=mapData["skyBoxOrigin"], scale=scale * mapData["skyBoxScale"], matSizes={})
+        for i, (brush, result) in enumerate(zip(mapData["skyEntityBrushes"], skyEntityGeo), lenWorld + lenEntBrushes + lenEnts + lenSky):
+            print(f"{i}|{total}|done", end="")
+            addBrushGeo(brush, result)
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
     for i, entity in enumerate(mapData["skyEntities"], lenWorld + lenEntBrushes + lenEnts + lenSky + lenSkyEntBrushes):
         print(f"{i}|{total}|done", end="")
@@ -993,18 +1067,18 @@ def exportMap(
         AABBmin.set(AABBmin.min(origin))
 
         if entity["classname"].startswith("prop_"):
-            res.entities.append(convertProp(entity, game, mapData["skyBoxOrigin"], mdlScale=mapData["skyBoxScale"], scale=scale * mapData["skyBoxScale"]))
+            mapEntities.append(convertProp(entity, game, mapData["skyBoxOrigin"], mdlScale=mapData["skyBoxScale"], scale=scale * mapData["skyBoxScale"]))
         elif entity["classname"] == "move_rope" or entity["classname"] == "keyframe_rope":
             if game == "CoD4":
                 convertRope(entity, skyOrigin=mapData["skyBoxOrigin"], scale=scale * mapData["skyBoxScale"], curve=True, ropeDict=ropeDict)
             else:
-                res.entities.append(convertRope(entity, skyOrigin=mapData["skyBoxOrigin"], scale=scale * mapData["skyBoxScale"]))
+                mapEntities.append(convertRope(entity, skyOrigin=mapData["skyBoxOrigin"], scale=scale * mapData["skyBoxScale"]))
 
     # convert ropes to curve patches for cod 4
     if game == "CoD4" or game == "CoD2":
         for val in ropeDict["start"].values(): 
             if val["target"] in ropeDict["end"]:
-                world.geo.append(convertRopeAsCurve(
+                res.writeGeo(convertRopeAsCurve(
                     val["origin"],
                     ropeDict["end"][val["target"]]["origin"],
                     val["slack"],
@@ -1015,9 +1089,11 @@ def exportMap(
     # create sky brushes and other necessary stuff
     skyBrushes, volumes = createSkyBrushes(AABBmin, AABBmax, mapName, game)
     if skyBrushes is not None:
-        world.geo.append(skyBrushes)
+        res.writeGeo(skyBrushes)
+    res.endEntity()
+
     if volumes is not None:
-        res.entities.append(volumes)
+        mapEntities.append(volumes)
 
     # convert overlays
     # i = 0
@@ -1054,7 +1130,7 @@ def exportMap(
             # top left
             origin = Vector3(x, y, z) * scale
 
-            res.entities.append(cod.Entity({
+            mapEntities.append(cod.Entity({
                 "classname": "script_origin",
                 "origin": f"{origin}",
                 "targetname": "minimap_corner",
@@ -1062,7 +1138,7 @@ def exportMap(
             }))
 
             # bottom right
-            res.entities.append(cod.Entity({
+            mapEntities.append(cod.Entity({
                 "classname": "script_origin",
                 "origin": f"{origin.y} {origin.x} {z}",
                 "targetname": "minimap_corner",
@@ -1082,34 +1158,6 @@ def exportMap(
     if game != "BO3":
         open(f"{copyDir}/converted/bin/_convert_{mapName}_assets.bat", "w").write(gdtFile.toBat())
 
-    if game == "BO3":
-        res.flags.append('"script_startingnumber" 0\n')
-        res.flags.append('"000_Global" flags expanded  active\n')
-        res.flags.append('"000_Global/No Comp" flags hidden ignore \n')
-        res.flags.append('"The Map" flags expanded \n')
-
-        world.properties.update({
-            "lightingquality": "1024",
-            "samplescale": "1",
-            "skyboxmodel": f"{mapName}_ssi",
-            "ssi": "default_day",
-            "wsi": "default_day",
-            "fsi": "default",
-            "gravity": "800",
-            "lodbias": "default",
-            "lutmaterial": "luts_t7_default",
-            "numOmniShadowSlices": "24",
-            "numSpotShadowSlices": "64",
-            "sky_intensity_factor0": "1",
-            "sky_intensity_factor1": "1",
-            "state_alias_1": "State 1",
-            "state_alias_2": "State 2",
-            "state_alias_3": "State 3",
-            "state_alias_4": "State 4"
-        })
-
-    else:
-        world.properties.update(worldSpawnSettings)
-    
     print("Writing map file...")
-    res.Save(file)
+    res.writeEntities(mapEntities)
+    res.flush()
@@ -1,19 +1,38 @@
 import os
+import re
 import numpy as np
 import time
 
 os.environ["NO_BPY"] = "1"
 
-from os.path import exists
+from io import BytesIO
 from posixpath import basename
-from tempfile import gettempdir
 from typing import Dict, List
 from SourceIO.source1.mdl.mdl_file import Mdl
 from SourceIO.source1.vtx.vtx import Vtx
 from SourceIO.source1.vvd.vvd import Vvd
+from PyCoD.xmodel import Model, Bone, Mesh, Vertex, Face, FaceVertex, Material
 from .Static import newPath
 from .Vector3 import Vector3
-from .Vector2 import Vector2
+
+# matches the trailing zeros of a number printed with %.6f, except for the first digit after the point
+trailingZeros = re.compile(r"0{1,5}\n")
+
+# formats an array of numbers the same way str(round(value, 6)) would, but all at once
+# signedZeros is False for the values that used to go through Vector3, which turns -0.0 into 0.0
+def formatFloats(values: np.ndarray, signedZeros=True) -> List[str]:
+    values = np.asarray(values, np.float64).ravel()
+    if len(values) == 0:
+        return []
+    numbers = values.tolist()
+    res = trailingZeros.sub("\n", ("%.6f\n" * len(numbers)) % tuple(numbers)).split("\n")[:-1]
+
+    # python switches to scientific notation below 0.0001
+    fix = (np.abs(values) < 0.0001) & ((values != 0) | (np.signbit(values) & (not signedZeros)))
+    for i in np.flatnonzero(fix).tolist():
+        value = round(numbers[i], 6)
+        res[i] = str(value if signedZeros else value + 0)
+    return res
 
 def merge_strip_groups(vtx_mesh):
     indices_accumulator = []
@@ -51,123 +70,188 @@ def merge_meshes(model, vtx_model):
 
     return vtx_vertices, np.hstack(indices_array), np.hstack(mat_arrays)
 
-def convertModel(filePath, writePath, tint="", skin=0, scale=1.0):
-    tempDir = f"{gettempdir()}/corvid/mdlMats"
-    # read mdl, vtx and vvd files
-    if not os.path.exists(f"{filePath}.mdl"):
-        print(f"Can't find {basename(filePath)}.mdl. Skipping...")
-        return
-    mdl = Mdl(f"{filePath}.mdl")
-    mdl.read()
-
-    vtx: Vtx
-    if os.path.exists(f"{filePath}.dx90.vtx"):
-        vtx = Vtx(f"{filePath}.dx90.vtx")
-        vtx.read()
-    elif os.path.exists(f"{filePath}.vtx"):
-        vtx = Vtx(f"{filePath}.dx90.vtx")
-        vtx.read()
-    else:
-        print(f"Can't find vtx file for the model {basename(filePath)}.mdl. Skipping...")
-        return
-
-    vvd = Vvd(f"{filePath}.vvd")
-    vvd.read()
-
-    # replace the material names when they have different skins
-    if skin != 0 and skin < len(mdl.skin_groups):
-        for i in range(len(mdl.skin_groups[skin])):
-            mdl.materials[i].name = mdl.skin_groups[skin][i]
-
-    materials = []
-    # check for the following and add if a material file exists with that name
-    for mat in mdl.materials:
-        # if the model contains the full path
-        name = newPath(mat.name)
-        if exists(f"{tempDir}/{name}.vmt"):
-            materials.append(name)
-            continue
-        
-        for path in mdl.materials_paths:
-            # if path/materialname exists
-            name = newPath(f"{path}/{mat.name}")
-            if exists(f"{tempDir}/{name}.vmt"):
-                materials.append(name)
-                continue
+# a model used in the map, its files are parsed once and shared by everything that needs them:
+# the materials are found through the parsed mdl and every skin and tint of the model is written from the same geometry
+class SourceModel:
+    def __init__(self, name: str, files: Dict[str, bytes]):
+        self.name = name
+        self.files = files
+        self.mdl: Mdl = None
 
-            # sometimes a material might contain both. we don't really need this but it won't hurt to have extra measures.
-            name = newPath(f"{path}/{basename(mat.name)}")
-            if exists(f"{tempDir}/{name}.vmt"):
-                materials.append(name)
-                continue
+        # the first lod of the model, read from the vtx and vvd files
+        self.hasGeometry = False
+        self.positions: np.ndarray = None
+        self.normals: np.ndarray = None
+        self.uvs: np.ndarray = None
+        self.indices: np.ndarray = None # 3 vertex indices for each triangle
+        self.faceMaterials: np.ndarray = None # material index of each triangle
+        self.faceGroups: np.ndarray = None # object index of each triangle
+        self.numGroups = 0
+
+    def readMdl(self):
+        if self.mdl is None:
+            if "mdl" not in self.files:
+                return False
+            self.mdl = Mdl(BytesIO(self.files["mdl"]))
+            self.mdl.read()
+        return True
+
+    def readGeometry(self):
+        if self.hasGeometry:
+            return True
+        if not self.readMdl():
+            print(f"Can't find {self.name}.mdl. Skipping...")
+            return False
+        mdl, files = self.mdl, self.files
+
+        vtx: Vtx
+        if "dx90.vtx" in files:
+            vtx = Vtx(BytesIO(files["dx90.vtx"]))
+            vtx.read()
+        elif "vtx" in files:
+            vtx = Vtx(BytesIO(files["vtx"]))
+            vtx.read()
+        else:
+            print(f"Can't find vtx file for the model {self.name}.mdl. Skipping...")
+            return False
+
+        if "vvd" not in files:
+            print(f"Can't find vvd file for the model {self.name}.mdl. Skipping...")
+            return False
+        vvd = Vvd(BytesIO(files["vvd"]))
+        vvd.read()
+
+        # start with empty arrays so models without any vertices still end up with arrays of the right shape
+        positions, normals, uvs = [np.zeros((0, 3), np.float32)], [np.zeros((0, 3), np.float32)], [np.zeros((0, 2), np.float32)]
+        indices, faceMaterials, faceGroups = [np.zeros((0, 3), np.uint32)], [np.zeros(0, int)], [np.zeros(0, int)]
+        numVerts = 0
+        numGroups = 1
+
+        desired_lod = 0
+        all_vertices = vvd.lod_data[desired_lod]
+
+        for mdl_parts, vtx_parts in zip(mdl.body_parts, vtx.body_parts):
+            for vtx_model, model in zip(vtx_parts.models, mdl_parts.models):
+                if model.vertex_count == 0:
+                    continue
+
+                model_vertices = get_slice(all_vertices, model.vertex_offset, model.vertex_count)
+                vtx_vertices, indices_array, material_indices_array = merge_meshes(model, vtx_model.model_lods[desired_lod])
+
+                indices_array = np.array(indices_array, dtype=np.uint32).reshape(-1, 3)
+                vertices = model_vertices[vtx_vertices]
+
+                positions.append(vertices["vertex"])
+                normals.append(vertices["normal"])
+                uvs.append(vertices["uv"])
+                indices.append(indices_array + numVerts)
+                faceMaterials.append(material_indices_array)
+
+                # every 1000 triangles of a body part model go in a new object
+                numFaces = len(indices_array)
+                faceGroups.append(numGroups - 1 + np.arange(numFaces) // 1000)
+                if numFaces > 0:
+                    numGroups += (numFaces - 1) // 1000
 
-    if tint != "":
-        materials = [mat + f"_{tint}" for mat in materials]
+                numVerts += len(vertices)
 
-    verts: List[Vector3] = []
-    vertDict: Dict[str, int] = {}
-    normals: List[Vector3] = []
-    uvs: List[Vector2] = []
-    groups = []
-    faces = []
-    
-    desired_lod = 0
-    all_vertices = vvd.lod_data[desired_lod]
+        self.positions = np.concatenate(positions)
+        self.normals = np.concatenate(normals)
+        self.uvs = np.concatenate(uvs)
+        self.indices = np.concatenate(indices)
+        self.faceMaterials = np.concatenate(faceMaterials)
+        self.faceGroups = np.concatenate(faceGroups)
+        self.numGroups = numGroups
+        self.hasGeometry = True
+        return True
 
-    groups.append("corvid_0")
+    # names of the materials of a skin that have a material file, vmts are the names of the model materials that exist
+    def getMaterials(self, vmts, skin=0, tint=""):
+        mdl = self.mdl
+        names = [mat.name for mat in mdl.materials]
 
-    for mdl_parts, vtx_parts in zip(mdl.body_parts, vtx.body_parts):
-        for vtx_model, model in zip(vtx_parts.models, mdl_parts.models):
-            if model.vertex_count == 0:
+        # replace the material names when they have different skins
+        if skin != 0 and skin < len(mdl.skin_groups):
+            for i in range(len(mdl.skin_groups[skin])):
+                names[i] = mdl.skin_groups[skin][i]
+
+        materials = []
+        # check for the following and add if a material file exists with that name
+        for matName in names:
+            # if the model contains the full path
+            name = newPath(matName)
+            if name in vmts:
+                materials.append(name)
                 continue
+            
+            for path in mdl.materials_paths:
+                # if path/materialname exists
+                name = newPath(f"{path}/{matName}")
+                if name in vmts:
+                    materials.append(name)
+                    continue
 
-            model_vertices = get_slice(all_vertices, model.vertex_offset, model.vertex_count)
-            vtx_vertices, indices_array, material_indices_array = merge_meshes(model, vtx_model.model_lods[desired_lod])
-
-            indices_array = np.array(indices_array, dtype=np.uint32)
-            vertices = model_vertices[vtx_vertices]
-
-            numVerts = len(verts)
-            numNormals = len(normals)
-            numUVs = len(uvs)
-            [verts.append((Vector3.FromArray(v) * scale).round(6)) for v in vertices["vertex"]]
-            [normals.append(Vector3.FromArray(n).round(6)) for n in vertices["normal"]]
-            [uvs.append(Vector2.FromArray(t).round(6)) for t in vertices["uv"]]
-
-            for i in range(0, len(indices_array), 3):
-                if i % 1000 == 0 and i != 0:
-                    groups.append(f"corvid_{len(groups)}")
-                    
-                faces.append({
-                    "points":[
-                        {
-                            "vert": numVerts + indices_array[i + 1],
-                            "normal": normals[numNormals + indices_array[i + 1]],
-                            "uv": uvs[numUVs + indices_array[i + 1]]
-                        },
-                        {
-                            "vert": numVerts + indices_array[i + 2],
-                            "normal": normals[numNormals + indices_array[i + 2]],
-                            "uv": uvs[numUVs + indices_array[i + 2]]
-                        },
-                        {
-                            "vert": numVerts + indices_array[i],
-                            "normal": normals[numNormals + indices_array[i]],
-                            "uv": uvs[numUVs + indices_array[i]]
-                        }
-                    ],
-                    "group": (len(groups) - 1),
-                    "material": material_indices_array[int(i / 3)]
-                })
+                # sometimes a material might contain both. we don't really need this but it won't hurt to have extra measures.
+                name = newPath(f"{path}/{basename(matName)}")
+                if name in vmts:
+                    materials.append(name)
+                    continue
 
+        if tint != "":
+            materials = [mat + f"_{tint}" for mat in materials]
+        return materials
+
+def getFileName(modelName, tint="", skin=0):
     if skin != 0 and tint != "":
-        fileName = basename(filePath) + f"_skin{skin}_{tint}"
+        return modelName + f"_skin{skin}_{tint}"
     elif tint != "":
-        fileName = basename(filePath) + f"_{tint}"
+        return modelName + f"_{tint}"
     elif skin != 0:
-        fileName = basename(filePath) + f"_skin{skin}"
+        return modelName + f"_skin{skin}"
     else:
-        fileName = basename(filePath)
+        return modelName
+
+# rounds the positions, normals and uvs to 6 decimals and formats them, normals that add up to zero get their y replaced with 1
+def formatVertexData(model: SourceModel, scale=1.0):
+    # each axis can be scaled separately
+    if isinstance(scale, Vector3):
+        scale = np.array((scale.x, scale.y, scale.z))
+    positions = formatFloats(model.positions.astype(np.float64) * scale, False)
+    normals = formatFloats(model.normals, False)
+    uvs = formatFloats(model.uvs)
+
+    rounded = np.array(normals, np.float64).reshape(-1, 3)
+    for i in np.flatnonzero(rounded[:, 0] + rounded[:, 1] + rounded[:, 2] == 0.0).tolist():
+        normals[i * 3 + 1] = "1.0"
+    return positions, normals, uvs
+
+# writes the xmodel_export file of a skin and tint of a model, returns False if the model couldn't be read
+def convertModel(model: SourceModel, writePath, vmts, tint="", skin=0, scale=1.0):
+    if not model.readGeometry():
+        return False
+    materials = model.getMaterials(vmts, skin, tint)
+    fileName = getFileName(model.name, tint, skin)
+
+    # everything is formatted in bulk, the vertex data of each corner of a triangle is formatted once per vertex
+    positions, normals, uvs = formatVertexData(model, scale)
+    p, n, t = iter(positions), iter(normals), iter(uvs)
+    verts = [
+        f"VERT {i}\nOFFSET {x} {y} {z}\nBONES 1\nBONE 0 1.000000\n\n"
+        for i, (x, y, z) in enumerate(zip(p, p, p))
+    ]
+    corners = [
+        f"NORMAL {nx} {ny} {nz}\nCOLOR 1.000000 1.000000 1.000000 1.000000\nUV 1 {u} {v}\n\n"
+        for nx, ny, nz, u, v in zip(n, n, n, t, t)
+    ]
+    # each triangle is formatted from a row of group, material and its corners, which are written in the opposite order
+    indices = model.indices[:, [1, 2, 0]]
+    rows = np.empty((len(indices), 8), object)
+    rows[:, 0] = model.faceGroups
+    rows[:, 1] = model.faceMaterials
+    rows[:, 2::2] = indices
+    rows[:, 3::2] = np.array(corners, object)[indices]
+    faces = ("TRI %d %d 0 0\nVERT %d\n%sVERT %d\n%sVERT %d\n%s" * len(indices)) % tuple(rows.ravel().tolist())
+    groups = [f"corvid_{i}" for i in range(model.numGroups)]
 
     with open(f"{writePath}/{fileName}.xmodel_export", "w") as file:
         file.write(
@@ -191,26 +275,10 @@ def convertModel(filePath, writePath, tint="", skin=0, scale=1.0):
         )
         
         file.write(f"NUMVERTS {len(verts)}\n\n")
-        for i in range(len(verts)):
-            file.write(
-                f"VERT {i}\n"
-                + f"OFFSET {verts[i].x} {verts[i].y} {verts[i].z}\n"
-                + "BONES 1\n"
-                + "BONE 0 1.000000\n\n"
-            )
+        file.write("".join(verts))
         
-        file.write(f"NUMFACES {len(faces)}\n\n")
-        for i in range(len(faces)):
-            file.write(f'TRI {faces[i]["group"]} {faces[i]["material"]} 0 0\n')
-            for point in faces[i]["points"]:
-                if point["normal"].x + point["normal"].y + point["normal"].z == 0.0:
-                    point["normal"].y = 1.000000
-                file.write(
-                    f'VERT {point["vert"]}\n'
-                    + f'NORMAL {point["normal"].x} {point["normal"].y} {point["normal"].z}\n'
-                    + "COLOR 1.000000 1.000000 1.000000 1.000000\n"
-                    + f'UV 1 {point["uv"].x} {point["uv"].y}\n\n'
-                )
+        file.write(f"NUMFACES {len(indices)}\n\n")
+        file.write(faces)
         
         file.write(f"NUMOBJECTS {len(groups)}\n")
         for i in range(len(groups)):
@@ -233,4 +301,59 @@ def convertModel(filePath, writePath, tint="", skin=0, scale=1.0):
                 + "REFLECTIVE -1 1.000000\n"
                 + "BLINN -1.000000 -1.000000\n"
                 + "PHONG -1.000000\n\n"
-            )
\ No newline at end of file
+            )
+
+    return True
+
+# writes the xmodel_bin file of a skin and tint of a model without going through an xmodel_export file
+# the model is built the same way LoadFile_Raw reads the xmodel_export written by convertModel:
+# every object is a mesh with its own vertices, and the faces point to the vertices of their mesh
+# returns False if the model couldn't be built or written
+def convertModelBin(model: SourceModel, dest, vmts, tint="", skin=0, scale=1.0):
+    if not model.readGeometry():
+        return False
+    materials = model.getMaterials(vmts, skin, tint)
+    color = (1.0, 1.0, 1.0, 1.0)
+
+    try:
+        # the values are rounded the same way they would be in the xmodel_export file
+        positions, normals, uvs = (
+            list(map(tuple, np.array(values, np.float64).reshape(-1, size).tolist()))
+            for values, size in zip(formatVertexData(model, scale), (3, 3, 2))
+        )
+
+        codModel = Model()
+        codModel.version = 6
+
+        bone = Bone("tag_origin", -1)
+        bone.offset = (0.0, 0.0, 0.0)
+        bone.matrix = [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)]
+        codModel.bones.append(bone)
+
+        # the corners of the triangles are in the same order as in the xmodel_export file
+        indices = model.indices[:, [1, 2, 0]]
+        for group in range(model.numGroups):
+            faces = np.flatnonzero(model.faceGroups == group)
+            groupIndices = indices[faces].ravel()
+            verts, localIndices = np.unique(groupIndices, return_inverse=True)
+
+            mesh = Mesh(f"corvid_{group}")
+            mesh.verts = [Vertex(positions[i], [(0, 1.0)]) for i in verts.tolist()]
+            for corners, localCorners, material in zip(
+                groupIndices.reshape(-1, 3).tolist(), localIndices.reshape(-1, 3).tolist(), model.faceMaterials[faces].tolist()
+            ):
+                face = Face(group, material)
+                face.indices = [
+                    FaceVertex(local, normals[i], color, uvs[i]) for i, local in zip(corners, localCorners)
+                ]
+                mesh.faces.append(face)
+            codModel.meshes.append(mesh)
+
+        for name in materials:
+            codModel.materials.append(Material(name, "Phong", {"color": "404.tga"}))
+
+        codModel.WriteFile_Bin(dest)
+    except Exception as e:
+        print(f"Could not write {basename(dest)} directly, converting it through xmodel_export instead: {e}")
+        return False
+    return True
@@ -93,7 +93,7 @@ class Overlay:
 
         vertices: List[Vector3] = []
         face_vertices: List[List[int]] = []
-        face_normals: List[Vector] = [side.normal().normalize().ToBpy() for side in self.sides]
+        face_normals: List[Vector] = [side.plane.normal.ToBpy() for side in self.sides]
 
         offset = 0.5
         if self.RenderOrder is not None:
@@ -0,0 +1,27 @@
+from math import fabs
+from typing import NamedTuple
+from .Vector3 import Vector3
+
+# the plane of a side, calculated once when the side is created as its 3 points never change after that
+class Plane(NamedTuple):
+    normal: Vector3 # unit length, or zero if the points are on a line
+    distance: float # distance from the origin along the normal
+    center: Vector3 # center of the 3 points that define the plane
+    axis: int # dominant axis of the normal (0: x, 1: y, 2: z), used for projecting lightmap uvs
+
+    @staticmethod
+    def FromPoints(p1: Vector3, p2: Vector3, p3: Vector3) -> 'Plane':
+        normal = (p2 - p1).cross(p3 - p1)
+        length = normal.len()
+        normal = normal / length if length != 0 else Vector3.Zero()
+
+        # ties go to z first, then y, same as the checks getLmapUV used to do
+        du, dr, df = fabs(normal.z), fabs(normal.y), fabs(normal.x)
+        if du >= dr and du >= df:
+            axis = 2
+        elif dr >= df:
+            axis = 1
+        else:
+            axis = 0
+
+        return Plane(normal, normal.dot(p1), (p1 + p2 + p3) / 3, axis)
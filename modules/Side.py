@@ -2,31 +2,25 @@ from .Vector3 import Vector3
 from .Vector2 import Vector2
 from mathutils import Vector, Matrix
 from numpy.linalg import solve
-from math import copysign, cos, degrees, pow, radians, sin, sqrt, fabs
+from math import atan2, copysign, cos, degrees, floor, pow, radians, sin, tau
 from .AABB import AABB
+from .Plane import Plane
+from itertools import product
+import numpy as np
 import re
-import functools
-
-def parseTriplets(tri: str):
-    res = []
-    tok = tri.split(" ")
-    i = 0
-    while i < len(tok):
-        res.append(Vector3(tok[i], tok[i + 1], tok[i + 2]))
-        i += 3
-    return res
-
-def parseSinglets(sin: str):
-    res = []
-    tok = sin.split(" ")
-    for val in tok:
-        res.append(float(val))
-    return res
+
+# the offsets of a grid cell and its 26 neighbours, used for welding vertices
+NEIGHBOURS = list(product((-1, 0, 1), repeat=3))
+
+# parses the rows of a displacement block ("row0", "row1"...) into an array with the shape (count, count, size)
+# all rows are split at once instead of creating a vector for every value
+def parseRows(rows, count: int, size: int = 1) -> np.ndarray:
+    values = np.array(" ".join(rows["row" + str(i)] for i in range(count)).split(), dtype=float)
+    return values.reshape((count, count, size) if size > 1 else (count, count))
 
 class Side:
     def __init__(self, data=None):
         self._center = None
-        self._normal = None
         self.points: list[Vector3] = []
         self.hasDisp = False
 
@@ -38,6 +32,7 @@ class Side:
             self.p1: Vector3 = Vector3(p[1], p[2], p[3])
             self.p2: Vector3 = Vector3(p[6], p[7], p[8])
             self.p3: Vector3 = Vector3(p[11], p[12], p[13])
+            self.plane: Plane = Plane.FromPoints(self.p1, self.p2, self.p3)
 
             self.material: str = data["material"].lower()
 
@@ -60,6 +55,7 @@ class Side:
 
         else:
             self.p1 = self.p2 = self.p3 = None
+            self.plane = None
             self.material = "null"
             self.id = "null"
     
@@ -67,24 +63,17 @@ class Side:
     def FromPoints(p1: Vector3, p2: Vector3, p3: Vector3):
         res = Side()
         res.p1, res.p2, res.p3 = p1, p2, p3
+        res.plane = Plane.FromPoints(p1, p2, p3)
         return res
 
-    def normal(self):
-        if self._normal is not None:
-            return self._normal
-
-        ab: Vector3 = self.p2 - self.p1
-        ac: Vector3 = self.p3 - self.p1
-        normal = ab.cross(ac)
-        self._normal = normal
-        return normal
+    def normal(self) -> Vector3:
+        return self.plane.normal
 
-    def center(self):
-        return (self.p1 + self.p2 + self.p3) / 3
+    def center(self) -> Vector3:
+        return self.plane.center
 
-    def distance(self):
-        normal: Vector3 = self.normal()
-        return ((self.p1.x * normal.x) + (self.p1.y * normal.y) + (self.p1.z * normal.z)) / sqrt(pow(normal.x, 2) + pow(normal.y, 2) + pow(normal.z, 2))
+    def distance(self) -> float:
+        return self.plane.distance
 
     def pointCenter(self):
         if self._center is not None:
@@ -99,23 +88,32 @@ class Side:
 
     def sortVertices(self):
         # remove duplicate verts
+        # points are snapped to a grid as big as the tolerance of Vector3.__eq__ so each point
+        # only needs to be compared with the points in its own cell and the ones around it
+        cells = {}
         temp = []
         for point in self.points:
-            if point not in temp:
-                temp.append(point)
+            key = (floor(point.x * 10), floor(point.y * 10), floor(point.z * 10))
+            if any(point == other for x, y, z in NEIGHBOURS for other in cells.get((key[0] + x, key[1] + y, key[2] + z), ())):
+                continue
+            cells.setdefault(key, []).append(point)
+            temp.append(point)
         self.points = temp
+
+        if len(self.points) < 3:
+            return
+
+        # sort the verts clockwise around the normal, starting from the first one
         center: Vector3 = self.pointCenter()
         normal: Vector3 = self.normal()
+        u = self.points[0] - center
+        v = normal.cross(u)
 
-        def compare(a: Vector3, b: Vector3):
-            ca = center - a
-            cb = center - b
-            caXcb = ca.cross(cb)
-            if normal.dot(caXcb) > 0:
-                return 1
-            return -1
+        def angle(point: Vector3):
+            d = point - center
+            return -atan2(d.dot(v), d.dot(u)) % tau
 
-        self.points.sort(key=functools.cmp_to_key(compare))
+        self.points.sort(key=angle)
 
     def __eq__(self, rhs: 'Side'):
         return self.p1 == rhs.p1 and self.p2 == rhs.p2 and self.p3 == rhs.p3
@@ -132,19 +130,14 @@ class Side:
         )
     
     def getLmapUV(self, vertex: Vector3):
-        uv = Vector2(0, 0)
         texSize = Vector2(1024, 1024)
-        n = self.normal().normalize()
-        
-        du = fabs(n.dot(Vector3.Up()))
-        dr = fabs(n.dot(Vector3.Right()))
-        df = fabs(n.dot(Vector3.Forward()))
+        axis = self.plane.axis
 
-        if du >= dr and du >= df:
+        if axis == 2:
             uv = Vector2(vertex.x, -vertex.y)
-        elif dr >= du and dr >= df:
+        elif axis == 1:
             uv = Vector2(vertex.x, -vertex.z)
-        elif df >= du and df >= dr:
+        else:
             uv = Vector2(vertex.y, -vertex.z)
         
         # we're gonna assume the rotation is 0
@@ -157,19 +150,32 @@ class Side:
         uv /= self.lightmapScale
 
         return uv * 1024
+
+    # same as getLmapUV, but for a whole array of points with the shape (..., 3)
+    def getLmapUVs(self, points: np.ndarray) -> np.ndarray:
+        u, v = [(1, 2), (0, 2), (0, 1)][self.plane.axis]
+        uv = np.stack((points[..., u], -points[..., v]), axis=-1)
+
+        # we're gonna assume the rotation is 0 here too
+        uv = np.stack((
+            uv[..., 0] * cos(0) - uv[..., 1] * sin(0),
+            uv[..., 0] * sin(0) + uv[..., 1] * cos(0)
+        ), axis=-1)
+
+        return uv / 1024 / self.lightmapScale * 1024
     
     # based on https://github.com/GregLukosek/3DMath/blob/master/Math3D.cs#L242
     def getClosestPoint(self, point: Vector3):
-        normal = self.normal().normalize()
+        normal = self.plane.normal
         distance = normal.dot(point - self.p1) * -1
         translationVector = normal * distance
         return point + translationVector
     
     # based on https://gdbooks.gitbooks.io/3dcollisions/content/Chapter2/static_aabb_plane.html
     def IsTouching(self, box: AABB) -> bool:
-        normal = self.normal().normalize()
+        normal = self.plane.normal
         radius = box.extends.x * abs(normal.x) + box.extends.y * abs(normal.y) + box.extends.z * abs(normal.z)
-        distance = normal.dot(box.center) - self.distance()
+        distance = normal.dot(box.center) - self.plane.distance
         return abs(distance) <= radius
 
     # based on https://github.com/c-d-a/io_export_qmap
@@ -180,7 +186,7 @@ class Side:
         V = [v.ToBpy() for v in self.points]
         T = [self.getUV(t, self.texSize) for t in self.points]
 
-        n = self.normal().normalize().ToBpy()
+        n = self.plane.normal.ToBpy()
         
         world01 = V[1] - V[0]
         world02 = V[2] - V[0]
@@ -238,19 +244,16 @@ class Side:
             "power": int(data["power"]),
             "elevation": float(data["elevation"]),
             "subdiv": True if data["subdiv"] == "1" else False,
-            "row": []
         }
         startpos = data["startposition"].replace(
             "[", "").replace("]", "").split(" ")
         result["startpos"] = Vector3(
             float(startpos[0]), float(startpos[1]), (startpos[2]))
 
-        for i in range(int(pow(2, result["power"]) + 1)):
-            result["row"].append({
-                "normals": parseTriplets(data["normals"]["row" + str(i)]),
-                "distances": parseSinglets(data["distances"]["row" + str(i)]),
-                "alphas": parseSinglets(data["alphas"]["row" + str(i)])
-            })
+        numVerts = int(pow(2, result["power"]) + 1)
+        result["normals"] = parseRows(data["normals"], numVerts, 3)
+        result["distances"] = parseRows(data["distances"], numVerts)
+        result["alphas"] = parseRows(data["alphas"], numVerts)
         return result
 
     def __repr__(self) -> str:
@@ -1,16 +1,62 @@
 import vpk
-from typing import List
-from os.path import isdir, isfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from mmap import mmap, ACCESS_READ
+from os import walk
+from typing import Dict, List, Optional, Tuple, Union
+from os.path import isdir, isfile, relpath
 from shutil import copyfile
 from pathlib import Path
 from sys import exit
 from .Gma import Addon, load as loadGma
+from .Cache import loadIndex, saveIndex
+
+# kinds of mounted sources, files in vpks are preferred over the ones in addons and those over loose files
+PAK, ADDON, DIR = 0, 1, 2
+
+# reading files is mostly waiting on the disk, so this many of them are read at the same time
+IO_THREADS = 8
+
+# paths are looked up case insensitively, the same way the games do it on windows
+def normPath(path: str) -> str:
+    return path.replace("\\", "/").lower()
+
+# empty files can't be mapped
+def mapFile(path: str):
+    with open(path, "rb") as file:
+        return mmap(file.fileno(), 0, access=ACCESS_READ) if file.seek(0, 2) > 0 else b""
+
+def getArchivePath(pak: vpk.VPK, meta: tuple) -> str:
+    return pak._make_vpkfile_path(pak._make_meta_dict(meta))
+
+# reads the data of a file from the location SourceDir.locate returns, or only its first size bytes
+# unlike reading from a mapped file, this lets other threads run while it waits on the disk
+def readLocation(location: Tuple[str, int, int, bytes], size=-1) -> bytes:
+    path, offset, length, preload = location
+    if size >= 0:
+        preload = preload[:size]
+        length = size - len(preload) if length < 0 else min(length, size - len(preload))
+    if length == 0:
+        return preload
+
+    with open(path, "rb") as file:
+        file.seek(offset)
+        return preload + file.read(length)
+
+def decodeText(data) -> Optional[str]:
+    if data is None:
+        return None
+
+    return str(data, "utf-8", "replace").replace("\r\n", "\n").replace("\r", "\n")
 
 class SourceDir:
     def __init__(self):
         self.dirs = []
         self.paks: List[vpk.VPK] = []
         self.addons: List[Addon] = []
+        # every mounted file, mapped to the kind of source it's in, the source itself and its name in that source
+        self.index: Dict[str, Tuple[int, object, str]] = {}
+        # vpk archives that have been read from, they stay mapped until the conversion is done
+        self.archives: Dict[str, mmap] = {}
 
     def add(self, path):
         if isfile(path):
@@ -18,35 +64,55 @@ class SourceDir:
                 print(f"\"{path}\" is not a valid file.")
                 exit()
             if path.endswith(".vpk"):
-                self.paks.append(vpk.open(path))
+                pak = vpk.open(path)
+                # reading the directory tree of big vpks takes a while, so it's cached between conversions
+                pak.tree = loadIndex(path)
+                if pak.tree is None:
+                    pak.read_index()
+                    saveIndex(path, pak.tree)
+                self.paks.append(pak)
+                self.addToIndex(PAK, pak, pak.tree)
             elif path.endswith(".gma"):
-                self.addons.append(loadGma(path))
+                addon = loadGma(path)
+                self.addons.append(addon)
+                self.addToIndex(ADDON, addon, addon.entries)
 
         elif isdir(path):
             self.dirs.append(path)
+            self.addToIndex(DIR, path, [
+                relpath(f"{root}/{file}", path)
+                for root, _, files in walk(path)
+                for file in files
+            ])
         else:
             print(f"\"{path}\" is an invalid path.")
+
+    # the first mounted source of a kind wins, but a vpk still wins over an addon or a folder mounted before it
+    def addToIndex(self, kind: int, source, names):
+        index = self.index
+        for name in names:
+            key = normPath(name)
+            if key not in index or index[key][0] > kind:
+                index[key] = (kind, source, name)
+
+    def exists(self, src):
+        return normPath(Path(src).as_posix()) in self.index
     
     def copy(self, src, dest, silent=False):
-        src = Path(src).as_posix()
-        for pak in self.paks:
-            try:
-                pak.get_file(src).save(dest)
-            except:
-                continue
-            else:
-                return True
-            
-        for addon in self.addons:
-            if src in addon.entries:
-                addon.entries[src].save(dest)
-                return True
+        entry = self.index.get(normPath(Path(src).as_posix()))
 
-        for dir in self.dirs:
+        if entry is not None:
+            kind, source, name = entry
             try:
-                copyfile(f"{dir}/{src}", dest)
-            except:
-                continue
+                if kind == PAK:
+                    source.get_file(name).save(dest)
+                elif kind == ADDON:
+                    source.entries[name].save(dest)
+                else:
+                    copyfile(f"{source}/{name}", dest)
+            except Exception as e:
+                print(f"Could not extract file {src}: {e}")
+                return False
             else:
                 return True
         
@@ -54,22 +120,92 @@ class SourceDir:
             print(f"Could not find file {src}")
         return False
 
-    def open(self, src):
-        src = Path(src).as_posix()
-        for pak in self.paks:
-            try:
-                return pak.get_file(src).read()
-            except:
-                continue
-        
-        for addon in self.addons:
-            if src in addon.entries:
-                addon.entries[src].save()
-        
-        for dir in self.dirs:
-            try:
-                return open(f"{dir}/{src}").read()
-            except:
-                continue
-            
-        return None
\ No newline at end of file
+    # returns the contents of a file without extracting it
+    # loose files and files in vpk archives are slices of memory mapped files, so nothing is copied until the data is used
+    def read(self, src, silent=False) -> Optional[Union[bytes, memoryview]]:
+        entry = self.index.get(normPath(Path(src).as_posix()))
+
+        if entry is None:
+            if not silent:
+                print(f"Could not find file {src}")
+            return None
+
+        kind, source, name = entry
+        try:
+            if kind == PAK:
+                return self.readPak(source, name)
+            elif kind == ADDON:
+                return source.entries[name].read()
+            else:
+                return memoryview(mapFile(f"{source}/{name}"))
+        except Exception as e:
+            print(f"Could not read file {src}: {e}")
+            return None
+
+    def readPak(self, pak: vpk.VPK, name: str):
+        preload, _, _, _, offset, length = meta = pak.tree[name]
+        if length == 0:
+            return preload
+
+        archivePath = getArchivePath(pak, meta)
+        if archivePath not in self.archives:
+            self.archives[archivePath] = mapFile(archivePath)
+        data = memoryview(self.archives[archivePath])[offset:offset + length]
+
+        # small files can have their beginning stored in the directory file
+        return preload + data if len(preload) > 0 else data
+
+    # same as read, but decodes the file as text with its line endings normalized like open() would do
+    def open(self, src, silent=True) -> Optional[str]:
+        return decodeText(self.read(src, silent))
+
+    # returns the file the data of a file is stored in, where it starts in that file, its size (-1 for the whole file)
+    # and the bytes that are stored separately before it
+    def locate(self, src) -> Optional[Tuple[str, int, int, bytes]]:
+        entry = self.index.get(normPath(Path(src).as_posix()))
+
+        if entry is None:
+            return None
+
+        kind, source, name = entry
+        if kind == PAK:
+            preload, _, _, _, offset, length = meta = source.tree[name]
+            return getArchivePath(source, meta), offset, length, preload
+        elif kind == ADDON:
+            file = source.entries[name]
+            return source.path, source.file_block + file.offset, file.size, b""
+        else:
+            return f"{source}/{name}", 0, -1, b""
+
+    # reads a list of files in a pool of threads and returns their contents mapped to the paths they were asked with
+    # each file is read once, no matter how many times or with how many different spellings it is in the list
+    # if size is given, only that many bytes are read from the start of each file
+    def fetchAll(self, paths, silent=False, size=-1) -> Dict[str, Optional[bytes]]:
+        keys = {path: normPath(Path(path).as_posix()) for path in paths}
+        files = {}
+        for path, key in keys.items():
+            files.setdefault(key, path)
+
+        locations = {key: self.locate(path) for key, path in files.items()}
+        if not silent:
+            for key, location in locations.items():
+                if location is None:
+                    print(f"Could not find file {files[key]}")
+
+        # the progress is printed here instead of the threads, in the order the files are done
+        res = {}
+        with ThreadPoolExecutor(IO_THREADS) as executor:
+            futures = {
+                executor.submit(readLocation, location, size): key
+                for key, location in locations.items() if location is not None
+            }
+            total = len(futures)
+            for i, future in enumerate(as_completed(futures)):
+                print(f"{i}|{total}|done", end="")
+                key = futures[future]
+                try:
+                    res[key] = future.result()
+                except Exception as e:
+                    print(f"Could not read file {files[key]}: {e}")
+
+        return {path: res.get(key) for path, key in keys.items()}
@@ -78,11 +78,13 @@ def fixVmt(vmt: str):
         result += line + "\n" + res2
     return result
 
-def flatten(lst: list):
-    res = []
+# yields the items of nested lists one by one without building a new list
+def iterFlatten(lst: list):
     for i in lst:
         if isinstance(i, list):
-            res += flatten(i)
+            yield from iterFlatten(i)
         else:
-            res.append(i)
-    return res
+            yield i
+
+def flatten(lst: list):
+    return list(iterFlatten(lst))
@@ -1,7 +1,9 @@
-from math import pow, sqrt
+from math import sqrt
 from mathutils import Vector
 
 class Vector2:
+    __slots__ = ("x", "y")
+
     def __init__(self, a: float = float(0.0), b: float = float(0.0)):
         self.x = float(a)
         self.y = float(b)
@@ -32,7 +34,8 @@ class Vector2:
 
     def __eq__(self, rhs):
         if isinstance(rhs, self.__class__):
-            return (self - rhs).len() <= 0.01
+            dx, dy = self.x - rhs.x, self.y - rhs.y
+            return sqrt(dx * dx + dy * dy) <= 0.01
         return False
 
     def __str__(self):
@@ -51,7 +54,8 @@ class Vector2:
         return self / self.len()
 
     def distance(self, rhs):
-        return sqrt(pow(self.x - rhs.x, 2) + pow(self.y - rhs.y, 2))
+        dx, dy = self.x - rhs.x, self.y - rhs.y
+        return sqrt(dx * dx + dy * dy)
 
     def lerp(self, rhs, alpha):
         return Vector2(
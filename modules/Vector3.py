@@ -1,7 +1,9 @@
-from math import cos, pi, pow, sin, sqrt
+from math import cos, pi, sin, sqrt
 from mathutils import Vector
 
 class Vector3:
+    # millions of these get created while converting a map, so they shouldn't carry a __dict__ around
+    __slots__ = ("x", "y", "z")
 
     def __init__(self, a: float = float(0.0), b: float = float(0.0), c: float = float(0.0)):
         self.x = float(a) + 0
@@ -34,7 +36,8 @@ class Vector3:
 
     def __eq__(self, rhs) -> bool:
         if isinstance(rhs, self.__class__):
-            return (self - rhs).len() <= 0.1
+            dx, dy, dz = self.x - rhs.x, self.y - rhs.y, self.z - rhs.z
+            return sqrt(dx * dx + dy * dy + dz * dz) <= 0.1
         return False
 
     def __pow__(self, p) -> float:
@@ -69,7 +72,8 @@ class Vector3:
         )
 
     def distance(self, rhs) -> float:
-        return sqrt(pow(self.x - rhs.x, 2) + pow(self.y - rhs.y, 2) + pow(self.z - rhs.z, 2))
+        dx, dy, dz = self.x - rhs.x, self.y - rhs.y, self.z - rhs.z
+        return sqrt(dx * dx + dy * dy + dz * dz)
 
     def lerp(self, rhs, alpha) -> 'Vector3':
         return Vector3(
@@ -85,8 +89,9 @@ class Vector3:
 
     def isLegal(self, sides)-> bool:
         for side in sides:
-            facing = (self - side.center()).normalize()
-            if facing.dot(side.normal().normalize()) < -0.001:
+            plane = side.plane
+            facing = (self - plane.center).normalize()
+            if facing.dot(plane.normal) < -0.001:
                 return False
         return True
 
@@ -0,0 +1,54 @@
+import io
+from mmap import mmap
+from typing import Iterator, Tuple, Union
+from vmf_tool.parser import Namespace, pluralise
+
+# adds a block to its parent the same way vmf_tool's parser does
+# the first block with a name is stored as is, the following ones turn it into a list ("solid" -> "solids")
+def addBlock(parent: Namespace, name: str, block: Namespace):
+    plural = pluralise(name)
+    keys = parent.__dict__
+    if name in keys:
+        parent[plural] = [keys.pop(name), block]
+    elif plural in keys:
+        parent[plural].append(block)
+    else:
+        parent[name] = block
+
+# reads a vmf file line by line and yields its top level blocks as soon as they are closed
+# brushes in the world block are yielded one by one as "world.solid" before the world block itself
+# so the whole parse tree never has to be in memory at once
+def readBlocks(vmf: Union[str, io.TextIOBase, mmap]) -> Iterator[Tuple[str, Namespace]]:
+    if isinstance(vmf, str):
+        lines = io.StringIO(vmf)
+    elif isinstance(vmf, mmap):
+        lines = (line.decode("utf-8", "replace") for line in iter(vmf.readline, b""))
+    else:
+        lines = vmf
+
+    # blocks that are currently open, along with whether they get yielded on their own when closed
+    stack: list[Tuple[str, Namespace, bool]] = []
+    previousLine = ""
+
+    for lineNumber, line in enumerate(lines):
+        line = line.strip()
+        if line == "" or line.startswith("//"):
+            continue
+        elif line == "{":
+            name = previousLine.strip('"')
+            block = Namespace(_line=lineNumber)
+            detached = len(stack) == 0 or (len(stack) == 1 and stack[0][0] == "world" and name == "solid")
+            if not detached:
+                addBlock(stack[-1][1], name, block)
+            stack.append((name, block, detached))
+        elif line == "}":
+            name, block, detached = stack.pop()
+            if detached:
+                yield ("world." + name if len(stack) > 0 else name), block
+        elif '" "' in line and len(stack) > 0:
+            key, value = line.split('" "')
+            stack[-1][1][key.lstrip('"')] = value.rstrip('"')
+        elif line.count(" ") == 1 and len(stack) > 0:
+            key, value = line.split()
+            stack[-1][1][key] = value
+        previousLine = line
@@ -0,0 +1,165 @@
+import numpy as np
+from struct import Struct
+from typing import NamedTuple, Optional
+
+# the header of a vtf file is 80 bytes since 7.2, older versions have a shorter one
+# everything up to the low res image is the same in every version, so reading this much of a file is always enough
+HEADER_SIZE = 80
+
+# signature, version, header size, width, height, flags, frames, first frame, reflectivity, bump scale,
+# format, mip count, low res format, low res width, low res height
+headerStruct = Struct("<4s2II2HI2H4x3f4xfiBiBB")
+
+# the parts of the header that are needed to convert a texture without loading it
+class VtfHeader(NamedTuple):
+    version: tuple # major, minor
+    headerSize: int
+    width: int
+    height: int
+    flags: int
+    frames: int
+    format: int
+    mipCount: int
+    lowResFormat: int
+    lowResWidth: int
+    lowResHeight: int
+
+# returns the header of a vtf file, or None if the data isn't one
+# data only needs to contain the first HEADER_SIZE bytes of the file
+def readHeader(data) -> Optional[VtfHeader]:
+    if data is None or len(data) < headerStruct.size:
+        return None
+
+    (
+        signature, major, minor, headerSize, width, height, flags, frames, _, _, _, _, _,
+        format, mipCount, lowResFormat, lowResWidth, lowResHeight
+    ) = headerStruct.unpack_from(data)
+    if signature != b"VTF\0":
+        return None
+
+    return VtfHeader((major, minor), headerSize, width, height, flags, frames, format, mipCount, lowResFormat, lowResWidth, lowResHeight)
+
+# image formats that can be decoded without VTFLib
+IMAGE_FORMAT_DXT1 = 13
+IMAGE_FORMAT_DXT5 = 15
+IMAGE_FORMAT_DXT1_ONEBITALPHA = 20
+
+TEXTUREFLAGS_ENVMAP = 0x4000
+
+# resource that holds the high res image since 7.3
+HIGH_RES_IMAGE = b"\x30\0\0"
+
+def getBlockSize(format: int) -> Optional[int]:
+    if format in (IMAGE_FORMAT_DXT1, IMAGE_FORMAT_DXT1_ONEBITALPHA):
+        return 8
+    elif format == IMAGE_FORMAT_DXT5:
+        return 16
+    return None
+
+def getDxtSize(width: int, height: int, blockSize: int) -> int:
+    return max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * blockSize
+
+# returns the compressed blocks of the first frame of the largest mipmap of a dxt1 or dxt5 texture,
+# or None if the texture is in any other format or is a cubemap or volume texture
+def getDxtData(data, header: VtfHeader) -> Optional[memoryview]:
+    blockSize = getBlockSize(header.format)
+    if blockSize is None or header.flags & TEXTUREFLAGS_ENVMAP:
+        return None
+    if header.version >= (7, 2) and int.from_bytes(data[63:65], "little") > 1:
+        return None
+
+    if header.version >= (7, 3):
+        # the offset of the image is in the resource list that follows the header
+        numResources = int.from_bytes(data[68:72], "little")
+        offset = None
+        for i in range(80, 80 + numResources * 8, 8):
+            if bytes(data[i:i + 3]) == HIGH_RES_IMAGE:
+                offset = int.from_bytes(data[i + 4:i + 8], "little")
+        if offset is None:
+            return None
+    else:
+        # the low res image comes right after the header, and it's always dxt1 if there is one
+        if header.lowResWidth == 0 or header.lowResHeight == 0 or header.lowResFormat == -1:
+            lowResSize = 0
+        elif header.lowResFormat == IMAGE_FORMAT_DXT1:
+            lowResSize = getDxtSize(header.lowResWidth, header.lowResHeight, 8)
+        else:
+            return None
+        offset = header.headerSize + lowResSize
+
+    # mipmaps are stored from the smallest to the largest, each with all of its frames
+    for mip in range(max(header.mipCount, 1) - 1, 0, -1):
+        offset += getDxtSize(max(header.width >> mip, 1), max(header.height >> mip, 1), blockSize) * max(header.frames, 1)
+
+    size = getDxtSize(header.width, header.height, blockSize)
+    if offset + size > len(data):
+        return None
+    return memoryview(data)[offset:offset + size]
+
+# expands 5 or 6 bit color values to 8 bits
+def expandBits(values: np.ndarray, bits: int) -> np.ndarray:
+    return (values << (8 - bits)) | (values >> (2 * bits - 8))
+
+# decodes dxt1 or dxt5 blocks to a height*width*channels array
+# channels are any of "RGBA", "RGB" or a single channel, only the channels that are asked for are decoded
+def decodeDxt(blocks, width: int, height: int, format: int, channels="RGBA") -> np.ndarray:
+    blockSize = getBlockSize(format)
+    bw, bh = max(1, (width + 3) // 4), max(1, (height + 3) // 4)
+    blocks = np.frombuffer(blocks, np.uint8, bw * bh * blockSize).reshape(-1, blockSize)
+
+    # the color part is the last 8 bytes of a block: 2 colors in 565 and 2 bits per pixel
+    colors = blocks[:, -8:]
+    color0 = (colors[:, 0].astype(np.int32) | (colors[:, 1].astype(np.int32) << 8))
+    color1 = (colors[:, 2].astype(np.int32) | (colors[:, 3].astype(np.int32) << 8))
+    bits = np.ascontiguousarray(colors[:, 4:]).view("<u4").astype(np.int64)
+    indices = (bits >> (np.arange(16) * 2)) & 3
+    # dxt1 blocks whose first color isn't bigger have 3 colors and transparent black
+    threeColors = ((color0 <= color1) & (format != IMAGE_FORMAT_DXT5))[:, None]
+
+    res = []
+    for channel in channels:
+        if channel == "A" and format == IMAGE_FORMAT_DXT5:
+            # the alpha part is the first 8 bytes: 2 alphas and 3 bits per pixel
+            alpha0 = blocks[:, 0, None].astype(np.int32)
+            alpha1 = blocks[:, 1, None].astype(np.int32)
+            bits = np.zeros((len(blocks), 8), np.uint8)
+            bits[:, :6] = blocks[:, 2:8]
+            alphaIndices = (bits.view("<u8").astype(np.int64) >> (np.arange(16) * 3)) & 7
+            weights = np.arange(1, 7)
+            eight = np.concatenate([alpha0, alpha1, ((7 - weights) * alpha0 + weights * alpha1 + 3) // 7], 1)
+            weights = np.arange(1, 5)
+            six = np.concatenate([
+                alpha0, alpha1, ((5 - weights) * alpha0 + weights * alpha1 + 2) // 5,
+                np.zeros_like(alpha0), np.full_like(alpha0, 255)
+            ], 1)
+            palette = np.where(alpha0 > alpha1, eight, six)
+            res.append(np.take_along_axis(palette, alphaIndices, 1))
+        elif channel == "A":
+            res.append(np.where(threeColors & (indices == 3), 0, 255))
+        else:
+            shift, size = {"R": (11, 5), "G": (5, 6), "B": (0, 5)}[channel]
+            value0 = expandBits((color0 >> shift) & ((1 << size) - 1), size)[:, None]
+            value1 = expandBits((color1 >> shift) & ((1 << size) - 1), size)[:, None]
+            palette = np.concatenate([
+                value0, value1,
+                np.where(threeColors, (value0 + value1) // 2, (2 * value0 + value1 + 1) // 3),
+                np.where(threeColors, 0, (value0 + 2 * value1 + 1) // 3)
+            ], 1)
+            res.append(np.take_along_axis(palette, indices, 1))
+
+    # blocks of 4x4 pixels back to rows of pixels
+    pixels = np.stack(res, -1).astype(np.uint8).reshape(bh, bw, 4, 4, len(channels))
+    return pixels.transpose(0, 2, 1, 3, 4).reshape(bh * 4, bw * 4, len(channels))[:height, :width]
+
+# magic, size, flags, height, width, linear size, depth, mipmap count, pixel format size, pixel format flags, fourcc, caps
+ddsHeaderStruct = Struct("<4s7I44x2I4s20xI16x")
+
+# writes the compressed blocks of a dxt texture to a dds file as they are
+def writeDds(blocks, header: VtfHeader, dest: str):
+    fourCC = b"DXT5" if header.format == IMAGE_FORMAT_DXT5 else b"DXT1"
+    with open(dest, "wb") as file:
+        # caps, height, width, pixel format and linear size are set, the pixel format is a fourcc
+        file.write(ddsHeaderStruct.pack(
+            b"DDS ", 124, 0x81007, header.height, header.width, len(blocks), 0, 0, 32, 0x4, fourCC, 0x1000
+        ))
+        file.write(blocks)
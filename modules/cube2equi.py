@@ -1,6 +1,7 @@
 # taken from https://github.com/adamb70/Python-Spherical-Projection/blob/master/cube2equi.py
 
 import math
+import numpy as np
 
 def spherical_coordinates(i, j, w, h):
     """ Returns spherical coordinates of the pixel from the output image. """
@@ -125,3 +126,70 @@ def find_corresponding_pixel(i, j, w, h, n):
     cube_coords = raw_coordinates(raw_face_coords[0], raw_face_coords[1], raw_face_coords[2])
 
     return normalized_coordinates(face, cube_coords[0], cube_coords[1], n)
+
+def equirectangular_coordinates(w, h):
+    """
+    Same as find_corresponding_pixel, but for every pixel of the output image at once.
+
+    :return: Face, and x and y coordinates on that face (0-1, relative to the bottom-left corner) of each output pixel.
+    """
+    theta = (2*np.arange(w, dtype=np.float64)/w - 1)*math.pi
+    phi = (2*np.arange(h, dtype=np.float64)/h - 1)*(math.pi/2)
+    phi, theta = np.meshgrid(phi, theta, indexing="ij")
+
+    x = np.cos(phi) * np.cos(theta)
+    y = np.sin(phi) * np.ones_like(theta)
+    z = np.cos(phi) * np.sin(theta)
+
+    # same order and tolerance as get_face
+    largest_magnitude = np.maximum(np.maximum(np.abs(x), np.abs(y)), np.abs(z))
+    on_x = largest_magnitude - np.abs(x) < 0.00001
+    on_y = ~on_x & (largest_magnitude - np.abs(y) < 0.00001)
+    on_z = ~on_x & ~on_y
+
+    face = np.select(
+        [on_x & (x < 0), on_x, on_y & (y < 0), on_y, z < 0],
+        [FACE_X_POS, FACE_X_NEG, FACE_Y_POS, FACE_Y_NEG, FACE_Z_POS],
+        FACE_Z_NEG
+    )
+    # raw_face_coordinates
+    xc = np.select([on_x & (x < 0), on_x | on_y, z < 0], [-z, z, x], -x)
+    yc = np.select([on_x | on_z, y < 0], [y, x], -x)
+    ma = np.abs(np.select([on_x, on_y], [x, y], z))
+
+    return face, (xc/ma + 1) / 2, (yc/ma + 1) / 2
+
+def convert_cubemap(faces, w, h, bilinear=False):
+    """
+    Creates an equirectangular image from the faces of a cubemap, without putting them in a single image first.
+
+    :param faces: Dictionary of face identifiers and n*n*channels arrays
+    :param w: Width of output image
+    :param h: Height of output image
+    :param bilinear: Blend the 4 closest pixels of a face instead of taking the closest one
+    :return: h*w*channels array
+    """
+    # the face identifiers go from 1 to 6
+    cube = np.stack([faces[face] for face in range(1, 7)])
+    n = cube.shape[1]
+
+    face, x, y = equirectangular_coordinates(w, h)
+    index = face - 1
+
+    if not bilinear:
+        # same as normalized_coordinates, without leaving the face
+        x = np.clip(np.floor(x*n), 0, n-1).astype(np.intp)
+        y = np.clip(np.floor(y*n), 0, n-1).astype(np.intp)
+        return cube[index, y, x]
+
+    x = np.clip(x*n - 0.5, 0, n-1)
+    y = np.clip(y*n - 0.5, 0, n-1)
+    x0 = np.minimum(np.floor(x).astype(np.intp), n-2)
+    y0 = np.minimum(np.floor(y).astype(np.intp), n-2)
+    fx = (x - x0)[..., None]
+    fy = (y - y0)[..., None]
+
+    cube = cube.astype(np.float32)
+    top = cube[index, y0, x0] * (1 - fx) + cube[index, y0, x0 + 1] * fx
+    bottom = cube[index, y0 + 1, x0] * (1 - fx) + cube[index, y0 + 1, x0 + 1] * fx
+    return np.round(top * (1 - fy) + bottom * fy).astype(faces[FACE_Z_POS].dtype)